@@ -1,3 +1,12 @@
+import argparse
+import hashlib
+import math
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
 from scipy.constants import physical_constants
 import matplotlib.pyplot as plt
 import scipy.special as sp
@@ -5,9 +14,42 @@ import seaborn as sns
 import numpy as np
 
 ## 1. Describe a Normalized Radial Function Rₙₗ(r)
+def log_laguerre(k, alpha, x):
+    """ Evaluate the generalized Laguerre polynomial Lₖ^α(x) over a whole
+    array with the three-term recurrence
+    (j+1) Lⱼ₊₁ = (2j+1+α-x) Lⱼ - (j+α) Lⱼ₋₁,
+    rescaling elements that grow too large, so that high degrees do not
+    overflow. float32 input is evaluated in float32.
+    Args:
+        k (int): degree
+        alpha (float): generalization parameter
+        x (numpy.ndarray): evaluation points
+    Returns:
+        tuple: log|Lₖ^α(x)| and the sign of Lₖ^α(x)
+    """
+
+    x = np.asarray(x)
+    if not np.issubdtype(x.dtype, np.floating):
+        x = x.astype(float)
+    # Rescale before squaring could overflow the dtype
+    limit = math.sqrt(np.finfo(x.dtype).max)
+    log_scale = np.zeros_like(x)
+    previous = np.ones_like(x)
+    current = previous if k == 0 else 1 + alpha - x
+    for j in range(1, k):
+        previous, current = current, ((2 * j + 1 + alpha - x) * current - (j + alpha) * previous) / (j + 1)
+        scale = np.where(np.abs(current) > limit, 1 / limit, 1).astype(x.dtype)
+        current *= scale
+        previous *= scale
+        log_scale -= np.log(scale)
+    with np.errstate(divide='ignore'):
+        return log_scale + np.log(np.abs(current)), np.sign(current)
+
 def radial_function(n, l, r, a0):
     """ Compute the normalized radial part of the wavefunction using
     Laguerre polynomials and an exponential decay factor.
+    All factors are combined in log space, so that Rydberg states (n of 50
+    and more) neither overflow nor underflow.
     Args:
         n (int): principal quantum number
         l (int): azimuthal quantum number
@@ -17,14 +59,14 @@ def radial_function(n, l, r, a0):
         numpy.ndarray: wavefunction radial component
     """
 
-    laguerre = sp.genlaguerre(n - l - 1, 2 * l + 1)
-    p = 2 * r / (n * a0)
+    p = 2 * np.asarray(r) / (n * a0)
 
-    constant_factor = np.sqrt(
-        ((2 / n * a0) ** 3 * (sp.factorial(n - l - 1))) /
-        (2 * n * (sp.factorial(n + l)))
+    log_constant_factor = 0.5 * (
+        3 * math.log(2 / (n * a0)) + math.lgamma(n - l) -
+        math.log(2 * n) - math.lgamma(n + l + 1)
     )
-    return constant_factor * np.exp(-p / 2) * (p ** l) * laguerre(p)
+    log_laguerre_p, sign = log_laguerre(n - l - 1, 2 * l + 1, p)
+    return sign * np.exp(log_constant_factor - p / 2 + sp.xlogy(p.dtype.type(l), p) + log_laguerre_p)
 
 """The radial part of the wavefunction is constructed by the product of:
 
@@ -38,6 +80,8 @@ d) Laguerre polynomial: laguerre(p)
 Captures oscillations in the electron density as a function of radial distance.
 Laguerre polynomials describe how the electron density changes as the distance from the nucleus increases:
 laguerre = sp.genlaguerre(n — l — 1, 2 * l + 1)
+For large n, these factors span hundreds of orders of magnitude, and the factorials overflow. So the code evaluates the Laguerre polynomial with its recurrence relation and adds up the logarithms of all factors before exponentiating once:
+log_constant_factor - p / 2 + l * log(p) + log|laguerre(p)|
 
 Normalized radial distance from the nucleus:
 p = 2 * r / (n * a0)"""
@@ -55,13 +99,94 @@ def angular_function(m, l, theta, phi):
         numpy.ndarray: wavefunction angular component
     """
 
-    legendre = sp.lpmv(m, l, np.cos(theta))
+    return polar_function(m, l, np.cos(theta)) * np.cos(m * phi)
+
+
+def normalized_legendre(l, m, x):
+    """ Evaluate the normalized associated Legendre function
+    √((2l+1)/4π (l-|m|)!/(l+|m|)!) Pₗ^|m|(x) (without the Condon-Shortley
+    phase) over a whole array. It starts from the closed form of Pₘ^m,
+    taken in log space, and climbs in l with the normalized recurrence,
+    which stays stable for large l and m.
+    Args:
+        l (int): degree
+        m (int): order, only |m| is used
+        x (numpy.ndarray): evaluation points in [-1, 1]
+    Returns:
+        numpy.ndarray: normalized associated Legendre function
+    """
+
+    m = abs(m)
+    x = np.asarray(x)
+    if not np.issubdtype(x.dtype, np.floating):
+        x = x.astype(float)
+    # Pₘ^m ∝ (1-x²)^(m/2), with ∏(2i-1)/(2i) = (2m)!/(2^m m!)²
+    log_start = 0.5 * (math.log((2 * m + 1) / (4 * math.pi)) + math.lgamma(2 * m + 1) -
+                       2 * (m * math.log(2) + math.lgamma(m + 1)))
+    with np.errstate(divide='ignore'):
+        start = np.exp(log_start + sp.xlogy(x.dtype.type(0.5 * m), 1 - x ** 2))
+    if l == m:
+        return start
+    previous, current = start, math.sqrt(2 * m + 3) * x * start
+    for j in range(m + 2, l + 1):
+        a = math.sqrt((4 * j ** 2 - 1) / (j ** 2 - m ** 2))
+        b = math.sqrt(((j - 1) ** 2 - m ** 2) / (4 * (j - 1) ** 2 - 1))
+        previous, current = current, a * (x * current - b * previous)
+    return current
+
+def polar_function(m, l, cos_theta):
+    """ Compute the θ-dependent part of the angular function, i.e. everything
+    except the azimuthal factor, directly from cos θ.
+    Args:
+        m (int): magnetic quantum number
+        l (int): azimuthal quantum number
+        cos_theta (numpy.ndarray): cosine of the polar angle
+    Returns:
+        numpy.ndarray: normalized associated Legendre function
+    """
+
+    return normalized_legendre(l, m, cos_theta)
+
+
+def compare_with_scipy(n_max=10, points=20000):
+    """ Check the recurrence kernels against the closed-form scipy path
+    (sp.genlaguerre with factorials, sp.lpmv) for all states up to n_max,
+    and time both.
+    Args:
+        n_max (int): largest principal quantum number to compare
+        points (int): number of evaluation points
+    Returns:
+        dict: largest relative errors and total times of both paths
+    """
+
+    from time import perf_counter
+    r = np.linspace(0, 4 * n_max ** 2, points)
+    x = np.linspace(-1, 1, points)
+    errors = {'radial': 0.0, 'polar': 0.0}
+    times = {'recurrence': 0.0, 'scipy': 0.0}
+    for n in range(1, n_max + 1):
+        for l in range(n):
+            start = perf_counter()
+            fast = radial_function(n, l, r, 1.0)
+            times['recurrence'] += perf_counter() - start
+            start = perf_counter()
+            p = 2 * r / n
+            reference = np.sqrt((2 / n) ** 3 * sp.factorial(n - l - 1) / (2 * n * sp.factorial(n + l))) * \
+                np.exp(-p / 2) * p ** l * sp.genlaguerre(n - l - 1, 2 * l + 1)(p)
+            times['scipy'] += perf_counter() - start
+            errors['radial'] = max(errors['radial'], np.abs(fast - reference).max() / np.abs(reference).max())
+    for l in range(n_max):
+        for m in range(l + 1):
+            start = perf_counter()
+            fast = polar_function(m, l, x)
+            times['recurrence'] += perf_counter() - start
+            start = perf_counter()
+            reference = (-1) ** m * np.sqrt((2 * l + 1) * sp.factorial(l - m) /
+                                            (4 * np.pi * sp.factorial(l + m))) * sp.lpmv(m, l, x)
+            times['scipy'] += perf_counter() - start
+            errors['polar'] = max(errors['polar'], np.abs(fast - reference).max() / np.abs(reference).max())
+    return {**errors, **times}
 
-    constant_factor = ((-1) ** m) * np.sqrt(
-        ((2 * l + 1) * sp.factorial(l - np.abs(m))) /
-        (4 * np.pi * sp.factorial(l + np.abs(m)))
-    )
-    return constant_factor * legendre * np.real(np.exp(1.j * m * phi))
 """The angular part of the wavefunction is constructed by the product of:
 
 a) Constant factor: constant_factor
@@ -69,14 +194,279 @@ Normalizes the angular wavefunction.
 b) Legendre polynomial:
 Describes the angular dependence of the wavefunction based on the quantum numbers. Providing insight into the orientation and shape of electron orbitals around the nucleus for given quantum numbers.
 c) Exponential factor: np.real(np.exp(1.j * m * phi))
-Introduces a phase shift dependent on the magnetic quantum number m and the azimuthal angle φ.
+Introduces a phase shift dependent on the magnetic quantum number m and the azimuthal angle φ. Only its real part is used, so the code evaluates it as the real np.cos(m * phi).
 Legendre polynomials describe the spatial arrangement and directional characteristics of electron probability densities:
 legendre = sp.lpmv(m, l, np.cos(theta))
 """
 
+## Monte-Carlo sampling of electron positions
+def _inverse_cdf_table(grid, density):
+    """ Normalized cumulative distribution of a sampled density (trapezoidal
+    rule), as read-only arrays (cdf, grid) ready for np.interp. """
+    cdf = np.concatenate(([0], np.cumsum((density[1:] + density[:-1]) * np.diff(grid) / 2)))
+    cdf /= cdf[-1]
+    cdf.flags.writeable = False
+    grid.flags.writeable = False
+    return cdf, grid
+
+
+@lru_cache(maxsize=None)
+def radial_cdf(n, l, a0, table_size=4096):
+    """ Cached inverse-CDF table of the radial distribution r² Rₙₗ(r)².
+    The table reaches out to n (2n + 30) a0, far beyond the mean radius
+    (3n² - l(l+1)) a0 / 2, so the truncated tail is negligible.
+    Returns:
+        tuple: (cdf, r) arrays
+    """
+    r = np.linspace(0, a0 * n * (2 * n + 30), table_size)
+    return _inverse_cdf_table(r, (r * radial_function(n, l, r, a0)) ** 2)
+
+
+@lru_cache(maxsize=None)
+def polar_cdf(l, m, table_size=4096):
+    """ Cached inverse-CDF table of cos θ for the polar factor. With
+    dΩ = d(cos θ) dφ the density in cos θ is just the squared normalized
+    Legendre function, which only depends on |m|.
+    Returns:
+        tuple: (cdf, cos θ) arrays
+    """
+    cos_theta = np.linspace(-1, 1, table_size)
+    return _inverse_cdf_table(cos_theta, polar_function(abs(m), l, cos_theta) ** 2)
+
+
+def _sample_phi(m, size, rng):
+    """ Azimuthal angles from cos²(mφ) by rejection (acceptance 1/2), or
+    uniform for m = 0. """
+    if m == 0:
+        return rng.uniform(0, 2 * np.pi, size)
+    phi = np.empty(size)
+    filled = 0
+    while filled < size:
+        trial = rng.uniform(0, 2 * np.pi, 2 * (size - filled) + 16)
+        trial = trial[rng.random(len(trial)) < np.cos(m * trial) ** 2][:size - filled]
+        phi[filled:filled + len(trial)] = trial
+        filled += len(trial)
+    return phi
+
+
+def sample_electron_positions(n, l, m, a0_scale_factor, size, rng=None, batch=1_000_000):
+    """ Draw electron positions distributed as |ψₙₗₘ|² = Rₙₗ(r)² |Yₗₘ(θ,φ)|²,
+    with the same real azimuthal factor as angular_function. r and cos θ are
+    drawn independently from cached inverse-CDF tables and φ by rejection,
+    `batch` positions at a time, so repeated sampling of a state only costs
+    the random draws.
+    Args:
+        n (int): principal quantum number
+        l (int): azimuthal quantum number
+        m (int): magnetic quantum number
+        a0_scale_factor (float): Bohr radius scale factor
+        size (int): number of positions
+        rng (numpy.random.Generator or int): random generator or seed
+        batch (int): number of positions drawn per vectorized batch
+    Returns:
+        numpy.ndarray: (size, 3) array of x, y, z positions
+    """
+
+    rng = np.random.default_rng(rng)
+    a0 = a0_scale_factor * physical_constants['Bohr radius'][0] * 1e+12
+    r_cdf, r_grid = radial_cdf(n, l, a0)
+    u_cdf, u_grid = polar_cdf(l, abs(m))
+
+    positions = np.empty((size, 3))
+    for start in range(0, size, batch):
+        k = min(batch, size - start)
+        r = np.interp(rng.random(k), r_cdf, r_grid)
+        cos_theta = np.interp(rng.random(k), u_cdf, u_grid)
+        phi = _sample_phi(m, k, rng)
+        rho = r * np.sqrt(1 - cos_theta ** 2)
+        positions[start:start + k, 0] = rho * np.cos(phi)
+        positions[start:start + k, 1] = rho * np.sin(phi)
+        positions[start:start + k, 2] = r * cos_theta
+    return positions
+
+"""Instead of evaluating |ψ|² on a dense 3-D grid, a point cloud can be drawn from it directly. Since |ψ|² factorizes into a radial, a polar and an azimuthal part, each coordinate is sampled on its own: r from the radial probability r² R², cos θ from the squared Legendre function, φ from cos²(mφ). Inverse transform sampling turns uniform random numbers into samples through the inverse of the cumulative distribution, which is tabulated once per state:
+r = np.interp(rng.random(k), r_cdf, r_grid)"""
+
+## Reusable x-z grid evaluator
+class OrbitalGrid:
+    """ Wavefunctions on a fixed square grid in the x-z plane (y = 0).
+    The grid's r and cos θ are computed once, and the radial factors
+    (per n, l and Bohr radius) and angular factors (per l, m) are memoized,
+    so a gallery of states only multiplies precomputed pieces together.
+    The memo is a least recently used cache bounded by max_bytes, so large
+    grids and scans over the Bohr radius do not grow without limit.
+    Args:
+        grid_extent (float): the grid spans [-grid_extent, grid_extent] in x and z
+        grid_resolution (int): number of grid points per axis
+        dtype (numpy.dtype): float64, or float32 for half the memory and time
+        max_bytes (int): size bound of the memoized factors together
+    """
+
+    def __init__(self, grid_extent=480, grid_resolution=680, dtype=np.float64, max_bytes=2 ** 28):
+        z = x = np.linspace(-grid_extent, grid_extent, grid_resolution, dtype=dtype)
+        z, x = np.meshgrid(z, x)
+        self.r = np.sqrt(x ** 2 + z ** 2)
+        # The polar angle from the z axis; φ is 0 for x >= 0 and π for x < 0,
+        # so cos(mφ) is -1 on the x < 0 half for odd m and 1 everywhere else
+        self.cos_theta = np.divide(z, self.r, out=np.ones_like(z), where=self.r > 0)
+        self.x_negative = x < 0
+        self.max_bytes = max_bytes
+        self._factors = OrderedDict()
+        self._nbytes = 0
+
+    def _memoized(self, key, compute):
+        """ Factor of key from the memo, computing it on a miss and evicting
+        the least recently used factors beyond max_bytes. """
+        if key in self._factors:
+            self._factors.move_to_end(key)
+            return self._factors[key]
+        factor = self._factors[key] = compute()
+        self._nbytes += factor.nbytes
+        while self._nbytes > self.max_bytes and len(self._factors) > 1:
+            self._nbytes -= self._factors.popitem(last=False)[1].nbytes
+        return factor
+
+    def radial(self, n, l, a0_scale_factor):
+        """ Memoized radial factor Rₙₗ(r) on the grid. """
+        a0 = a0_scale_factor * physical_constants['Bohr radius'][0] * 1e+12
+        return self._memoized(('radial', n, l, a0_scale_factor),
+                              lambda: radial_function(n, l, self.r, a0))
+
+    def angular(self, l, m):
+        """ Memoized angular factor Yₗₘ(θ,φ) on the grid. """
+        def compute():
+            factor = polar_function(m, l, self.cos_theta)
+            if m % 2:
+                np.negative(factor, out=factor, where=self.x_negative)
+            return factor
+        return self._memoized(('angular', l, m), compute)
+
+    def wavefunction(self, n, l, m, a0_scale_factor):
+        """ Ψnlm(r,θ,φ) = Rnl(r).Ylm(θ,φ) from the memoized factors.
+        Returns:
+            numpy.ndarray: wavefunction
+        """
+        return self.radial(n, l, a0_scale_factor) * self.angular(l, m)
+
+    def clear(self):
+        """ Drop the memoized factors. """
+        self._factors.clear()
+        self._nbytes = 0
+
+
+@lru_cache(maxsize=1)
+def orbital_grid(grid_extent, grid_resolution, dtype=np.float64):
+    """ Shared OrbitalGrid of the last (extent, resolution, dtype). Only one
+    is kept per process, since with an 'auto' extent every shell has its
+    own grid, and at 4K each holds hundreds of MB. """
+    return OrbitalGrid(grid_extent, grid_resolution, dtype)
+
+
+def adaptive_extent(n, a0_scale_factor, coverage=0.99):
+    """ Grid extent that holds the given fraction of the radial probability
+    of every state of shell n, read from the cached radial CDF tables, so
+    no pixels are spent on empty space around the orbital.
+    Args:
+        n (int): principal quantum number
+        a0_scale_factor (float): Bohr radius scale factor
+        coverage (float): fraction of the probability inside the extent
+    Returns:
+        float: grid extent
+    """
+
+    a0 = a0_scale_factor * physical_constants['Bohr radius'][0] * 1e+12
+    return max(float(np.interp(coverage, *radial_cdf(n, l, a0))) for l in range(n))
+
+## On-disk cache of computed wavefunctions
+class ArrayCache:
+    """ Content-addressed on-disk cache of numpy arrays.
+    Every array is stored as <sha256 of its key>.npy, so equal parameters
+    always map to the same file, and hits are opened as read-only memory
+    maps, which takes milliseconds whatever the grid size. The modification
+    time of a file is its last use; once the files exceed max_bytes, the
+    least recently used ones are deleted. Writes go through a temporary file
+    and an atomic rename, so several processes can share one directory.
+    Args:
+        directory (str): cache directory, created on demand
+        max_bytes (int): size bound of all cached files together
+    """
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+    def path(self, key):
+        """ File of a key, any tuple of parameters with a stable repr. """
+        digest = hashlib.sha256(repr(key).encode()).hexdigest()
+        return os.path.join(self.directory, digest + '.npy')
+
+    def load(self, key):
+        """ Memory-mapped cached array of key, or None on a miss. """
+        path = self.path(key)
+        try:
+            array = np.load(path, mmap_mode='r')
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return array
+
+    def store(self, key, array):
+        """ Write array for key and evict the least recently used files. """
+        os.makedirs(self.directory, exist_ok=True)
+        # The .tmp suffix keeps files still being written out of evict()
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, array)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self, stale_seconds=24 * 3600):
+        """ Delete least recently used files until the total fits max_bytes.
+        Temporary files are skipped, unless they are older than stale_seconds
+        and so were left behind by a crashed writer. """
+        entries = []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+                if entry.name.endswith('.tmp') and now - stat.st_mtime > stale_seconds:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith('.npy'):
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def get(self, key, compute):
+        """ Cached array of key, computing and storing it on a miss. """
+        array = self.load(key)
+        if array is None:
+            array = compute()
+            self.store(key, array)
+        return array
+
+
+# Shared cache of compute_wavefunction; set H_ATOM_CACHE to another
+# directory, or to an empty string to switch the cache off.
+_cache_dir = os.environ.get('H_ATOM_CACHE', os.path.join(os.path.expanduser('~'), '.cache', 'h-atom'))
+wavefunction_cache = ArrayCache(_cache_dir) if _cache_dir else None
+
 ## 3. Compute the Normalized wavefunction ψₙₗₘ(r,θ,φ) as a product of
 
-def compute_wavefunction(n, l, m, a0_scale_factor):
+def compute_wavefunction(n, l, m, a0_scale_factor, grid_extent=480, grid_resolution=680,
+                         dtype=np.float64, cache=True):
     """ Compute the normalized wavefunction as a product
     of its radial and angular components.
     Args:
@@ -84,29 +474,32 @@ def compute_wavefunction(n, l, m, a0_scale_factor):
         l (int): azimuthal quantum number
         m (int): magnetic quantum number
         a0_scale_factor (float): Bohr radius scale factor
+        grid_extent (float or str): the grid spans [-grid_extent, grid_extent],
+            or 'auto' for adaptive_extent(n, a0_scale_factor), defaults to 480
+        grid_resolution (int): number of grid points per axis, defaults to 680
+        dtype (numpy.dtype): float64, or float32 for half the memory and time
+        cache (bool or ArrayCache): look the result up in wavefunction_cache
+            (or the given cache) first, defaults to True
     Returns:
-        numpy.ndarray: wavefunction
+        numpy.ndarray: wavefunction (read-only when it comes from the cache)
     """
 
-    # Scale Bohr radius for effective visualization
-    a0 = a0_scale_factor * physical_constants['Bohr radius'][0] * 1e+12
-
-    # x-y grid to represent electron spatial distribution
-    grid_extent = 480
-    grid_resolution = 680
-    z = x = np.linspace(-grid_extent, grid_extent, grid_resolution)
-    z, x = np.meshgrid(z, x)
+    if grid_extent == 'auto':
+        grid_extent = adaptive_extent(n, a0_scale_factor)
+    dtype = np.dtype(dtype)
 
-    # Use epsilon to avoid division by zero during angle calculations
-    eps = np.finfo(float).eps
+    def compute():
+        # The grid is only built on a miss, so a hit only opens the memmap
+        grid = orbital_grid(float(grid_extent), int(grid_resolution), dtype)
+        return grid.wavefunction(n, l, m, a0_scale_factor)
 
-    # Ψnlm(r,θ,φ) = Rnl(r).Ylm(θ,φ)
-    psi = radial_function(
-        n, l, np.sqrt((x ** 2 + z ** 2)), a0
-    ) * angular_function(
-        m, l, np.arctan(x / (z + eps)), 0
-    )
-    return psi
+    if cache is True:
+        cache = wavefunction_cache
+    if not cache:
+        return compute()
+    # The version tag invalidates old entries whenever the evaluation changes
+    key = ('psi-v1', n, l, m, float(a0_scale_factor), float(grid_extent), int(grid_resolution), dtype.str)
+    return cache.get(key, compute)
 
 """The Bohr radius sets the scale of the wavefunction and determines the size of the atom. By scaling it, we adapt the wavefunction’s spatial extent for effective visualization:
 a0 = a0_scale_factor * physical_constants[‘Bohr radius’][0] * 1e+12
@@ -133,20 +526,72 @@ def compute_probability_density(psi):
 """Here we return the square magnitude of the wavefunction, encapsulating the probability of the electron’s presence in different regions of the atom:
 return np.abs(psi) ** 2"""
 
-## 5. Plot the Probability Density
-
-def plot_wf_probability_density(n, l, m, a0_scale_factor, dark_theme=False, colormap='rocket'):
-    """ Plot the probability density of the hydrogen
-    atom's wavefunction for a given quantum state (n,l,m).
+## Volumetric probability density
+def _mirror(q, h, axis):
+    """ Rebuild a symmetric axis from its upper half q, whose first point is
+    index h of the full axis. """
+    lower = np.flip(np.take(q, np.arange(q.shape[axis] - h, q.shape[axis]), axis=axis), axis=axis)
+    return np.concatenate((lower, q), axis=axis)
+
+
+def compute_probability_volume(n, l, m, a0_scale_factor, filename, grid_extent=480,
+                               grid_resolution=512, slab=16):
+    """ Compute |ψₙₗₘ|² on a cubic (z, y, x) grid and write it to a
+    memory-mapped .npy file, slab by slab along z, so only `slab` planes
+    are held in memory at a time.
+    The density is a product of Rₙₗ(r)², the polar factor and cos²(mφ), and
+    it is symmetric under x → -x, y → -y and z → -z. So every slab is only
+    evaluated on the quadrant x, y >= 0 and mirrored, only the slabs with
+    z >= 0 are evaluated, and cos²(mφ) is computed once for the whole x-y
+    plane (and skipped for m = 0, where the density is azimuthally
+    symmetric).
     Args:
-        n (int): principal quantum number, determines the energy level and size of the orbital
-        l (int): azimuthal quantum number, defines the shape of the orbital
-        m (int): magnetic quantum number, defines the orientation of the orbital
+        n (int): principal quantum number
+        l (int): azimuthal quantum number
+        m (int): magnetic quantum number
         a0_scale_factor (float): Bohr radius scale factor
-        dark_theme (bool): If True, uses a dark background for the plot, defaults to False
-        colormap (str): Seaborn plot colormap, defaults to 'rocket'
+        filename (str): path of the .npy file to write
+        grid_extent (float): the grid spans [-grid_extent, grid_extent] along each axis
+        grid_resolution (int): number of grid points per axis
+        slab (int): number of z planes computed at once
+    Returns:
+        numpy.memmap: the (z, y, x) float32 probability density
     """
 
+    a0 = a0_scale_factor * physical_constants['Bohr radius'][0] * 1e+12
+    axis = np.linspace(-grid_extent, grid_extent, grid_resolution)
+    h = grid_resolution // 2
+    q = axis[h:]  # non-negative half of the axis (the grid is symmetric)
+    rho2 = np.add.outer(q ** 2, q ** 2)  # (y, x) quadrant
+    azimuthal = None
+    if m != 0:
+        azimuthal = np.cos(m * np.arctan2(*np.meshgrid(q, q, indexing='ij'))) ** 2
+
+    volume = np.lib.format.open_memmap(filename, mode='w+', dtype=np.float32,
+                                       shape=(grid_resolution,) * 3)
+    for start in range(0, len(q), slab):
+        z = q[start:start + slab, None, None]
+        r = np.sqrt(rho2 + z ** 2)
+        cos_theta = np.divide(z, r, out=np.ones_like(r), where=r > 0)
+        density = (radial_function(n, l, r, a0) * polar_function(m, l, cos_theta)) ** 2
+        if azimuthal is not None:
+            density *= azimuthal
+        density = _mirror(_mirror(density, h, 1), h, 2)
+        # Upper slab and its mirror image below z = 0
+        volume[h + start:h + start + len(z)] = density
+        lower = np.arange(h - start - len(z), h - start) + len(q) - h
+        keep = lower >= 0
+        volume[lower[keep]] = density[::-1][keep]
+    volume.flush()
+    return volume
+
+"""For volume rendering we need |ψ|² everywhere in space, not only in the x-z plane. A 512³ grid of float32 takes 512 MB, so it is written straight into a memory-mapped .npy file, which can be loaded lazily with np.load(filename, mmap_mode='r') and handed to a volume renderer or an isosurface extraction such as skimage.measure.marching_cubes."""
+
+## 5. Plot the Probability Density
+
+def validate_state(n, l, m, colormap='rocket'):
+    """ Check the quantum numbers and the colormap, raising ValueError. """
+
     # Quantum numbers validation
     if not isinstance(n, int) or n < 1:
         raise ValueError('n should be an integer satisfying the condition: n >= 1')
@@ -161,7 +606,9 @@ def plot_wf_probability_density(n, l, m, a0_scale_factor, dark_theme=False, colo
     except ValueError:
         raise ValueError(f'{colormap} is not a recognized Seaborn colormap.')
 
-    # Configure plot aesthetics using matplotlib rcParams settings
+
+def apply_plot_style():
+    """ Configure plot aesthetics using matplotlib rcParams settings. """
     plt.rcParams['font.family'] = 'STIXGeneral'
     plt.rcParams['mathtext.fontset'] = 'stix'
     plt.rcParams['xtick.major.width'] = 4
@@ -172,19 +619,28 @@ def plot_wf_probability_density(n, l, m, a0_scale_factor, dark_theme=False, colo
     plt.rcParams['ytick.labelsize'] = 30
     plt.rcParams['axes.linewidth'] = 4
 
+
+def draw_wf_probability_density(n, l, m, prob_density, dark_theme=False, colormap='rocket'):
+    """ Draw a probability density in a new figure, using the current style.
+    The theme colors are passed to every artist, so the rcParams stay untouched.
+    Args:
+        n, l, m (int): quantum numbers, for the label
+        prob_density (numpy.ndarray): probability density on the x-z grid
+        dark_theme (bool): If True, uses a dark background for the plot, defaults to False
+        colormap (str): Seaborn plot colormap, defaults to 'rocket'
+    Returns:
+        tuple: the figure and the theme tag ('dt' or 'lt') of the file name
+    """
+
     fig, ax = plt.subplots(figsize=(16, 16.5))
-    plt.subplots_adjust(top=0.82)
-    plt.subplots_adjust(right=0.905)
-    plt.subplots_adjust(left=-0.1)
+    fig.subplots_adjust(top=0.82)
+    fig.subplots_adjust(right=0.905)
+    fig.subplots_adjust(left=-0.1)
 
-    # Compute and visualize the wavefunction probability density
-    psi = compute_wavefunction(n, l, m, a0_scale_factor)
-    prob_density = compute_probability_density(psi)
-    
     # Here we transpose the array to align the calculated z-x plane with Matplotlib's y-x imshow display
     im = ax.imshow(np.sqrt(prob_density).T, cmap=sns.color_palette(colormap, as_cmap=True))
 
-    cbar = plt.colorbar(im, fraction=0.046, pad=0.03)
+    cbar = fig.colorbar(im, ax=ax, fraction=0.046, pad=0.03)
     cbar.set_ticks([])
 
     # Apply dark theme parameters
@@ -194,8 +650,7 @@ def plot_wf_probability_density(n, l, m, a0_scale_factor, dark_theme=False, colo
             sns.color_palette(colormap, n_colors=100),
             key=lambda color: 0.2126 * color[0] + 0.7152 * color[1] + 0.0722 * color[2]
         )[0]
-        plt.rcParams['text.color'] = '#dfdfdf'
-        title_color = '#dfdfdf'
+        text_color = '#dfdfdf'
         fig.patch.set_facecolor(background_color)
         cbar.outline.set_visible(False)
         ax.tick_params(axis='x', colors='#c4c4c4')
@@ -205,27 +660,52 @@ def plot_wf_probability_density(n, l, m, a0_scale_factor, dark_theme=False, colo
 
     else:  # Apply light theme parameters
         theme = 'lt'
-        plt.rcParams['text.color'] = '#000000'
-        title_color = '#000000'
+        text_color = '#000000'
         ax.tick_params(axis='x', colors='#000000')
         ax.tick_params(axis='y', colors='#000000')
 
+    # Label positions are laid out for the 680 point grid; scale them to this one
+    s = prob_density.shape[0] / 680
     ax.set_title('Hydrogen Atom - Wavefunction Electron Density', 
-                 pad=130, fontsize=44, loc='left', color=title_color)
-    ax.text(0, 722, (
+                 pad=130, fontsize=44, loc='left', color=text_color)
+    ax.text(0, 722 * s, (
         r'$|\psi_{n \ell m}(r, \theta, \varphi)|^{2} ='
         r' |R_{n\ell}(r) Y_{\ell}^{m}(\theta, \varphi)|^2$'
-    ), fontsize=36)
-    ax.text(30, 615, r'$({0}, {1}, {2})$'.format(n, l, m), color='#dfdfdf', fontsize=42)
-    ax.text(770, 140, 'Electron probability distribution', rotation='vertical', fontsize=40)
-    ax.text(705, 700, 'Higher\nprobability', fontsize=24)
-    ax.text(705, -60, 'Lower\nprobability', fontsize=24)
-    ax.text(775, 590, '+', fontsize=34)
-    ax.text(769, 82, '−', fontsize=34, rotation='vertical')
+    ), fontsize=36, color=text_color)
+    ax.text(30 * s, 615 * s, r'$({0}, {1}, {2})$'.format(n, l, m), color='#dfdfdf', fontsize=42)
+    ax.text(770 * s, 140 * s, 'Electron probability distribution', rotation='vertical', fontsize=40, color=text_color)
+    ax.text(705 * s, 700 * s, 'Higher\nprobability', fontsize=24, color=text_color)
+    ax.text(705 * s, -60 * s, 'Lower\nprobability', fontsize=24, color=text_color)
+    ax.text(775 * s, 590 * s, '+', fontsize=34, color=text_color)
+    ax.text(769 * s, 82 * s, '−', fontsize=34, rotation='vertical', color=text_color)
     ax.invert_yaxis()
+    return fig, theme
+
+
+def plot_wf_probability_density(n, l, m, a0_scale_factor, dark_theme=False, colormap='rocket',
+                                grid_extent=480, grid_resolution=680, dtype=np.float64):
+    """ Plot the probability density of the hydrogen
+    atom's wavefunction for a given quantum state (n,l,m).
+    Args:
+        n (int): principal quantum number, determines the energy level and size of the orbital
+        l (int): azimuthal quantum number, defines the shape of the orbital
+        m (int): magnetic quantum number, defines the orientation of the orbital
+        a0_scale_factor (float): Bohr radius scale factor
+        dark_theme (bool): If True, uses a dark background for the plot, defaults to False
+        colormap (str): Seaborn plot colormap, defaults to 'rocket'
+        grid_extent, grid_resolution, dtype: grid of compute_wavefunction
+    """
+
+    validate_state(n, l, m, colormap)
+    apply_plot_style()
+
+    # Compute and visualize the wavefunction probability density
+    psi = compute_wavefunction(n, l, m, a0_scale_factor, grid_extent, grid_resolution, dtype)
+    prob_density = compute_probability_density(psi)
+    fig, theme = draw_wf_probability_density(n, l, m, prob_density, dark_theme, colormap)
 
     # Save and display the plot
-    plt.savefig(f'({n},{l},{m})[{theme}].png')
+    fig.savefig(f'({n},{l},{m})[{theme}].png')
     plt.show()
 
     """In this code snippet, you’ll notice that a significant portion is dedicated to styling, thematics and data validation. The core functionality that computes and visualizes the electron probability distribution is encapsulated in just a few lines. Specifically, the key steps involve:
@@ -237,7 +717,104 @@ prob_density = compute_probability_density(psi)
 c) Plotting the data
 im = ax.imshow(np.sqrt(prob_density), cmap=sns.color_palette(...))"""
 
-plot_wf_probability_density(6, 3, -1, 0.3, True)
+## 6. Render a Gallery of States
+
+def all_states(n_max):
+    """ All (n, l, m) states with n <= n_max. """
+    return [(n, l, m) for n in range(1, n_max + 1) for l in range(n) for m in range(-l, l + 1)]
+
+
+def gallery_scale_factor(n, grid_extent=480, coverage=0.99):
+    """ Bohr radius scale factor at which every state of shell n holds the
+    given fraction of its radial probability inside grid_extent. Radii
+    scale with the Bohr radius, so it is grid_extent over the
+    adaptive_extent of the unscaled shell.
+    Args:
+        n (int): principal quantum number
+        grid_extent (float): half width of the grid
+        coverage (float): fraction of the probability inside the extent
+    Returns:
+        float: Bohr radius scale factor
+    """
+    return grid_extent / adaptive_extent(n, 1.0, coverage)
+
+
+def _init_gallery_worker():
+    # Headless backend and plot style, once per worker process
+    plt.switch_backend('Agg')
+    apply_plot_style()
+
+
+def _render_state(task):
+    (n, l, m), a0_scale_factor, dark_theme, colormap, out_dir, grid = task
+    if a0_scale_factor is None:
+        # An 'auto' extent follows the Bohr radius, so any scale fits
+        a0_scale_factor = gallery_scale_factor(n, 480 if grid[0] == 'auto' else grid[0])
+    prob_density = compute_probability_density(compute_wavefunction(n, l, m, a0_scale_factor, *grid))
+    fig, theme = draw_wf_probability_density(n, l, m, prob_density, dark_theme, colormap)
+    filename = os.path.join(out_dir, f'({n},{l},{m})[{theme}].png')
+    fig.savefig(filename)
+    plt.close(fig)
+    return filename
+
+
+def render_gallery(states, a0_scale_factor=None, dark_theme=False, colormap='rocket',
+                   out_dir='.', processes=None, grid_extent=480, grid_resolution=680,
+                   dtype=np.float64):
+    """ Render the probability densities of many states to PNG files
+    without opening a window. Every worker process uses the Agg backend,
+    sets the plot style once, and evaluates the states through its shared
+    OrbitalGrid. The states are handed out in order in contiguous chunks,
+    so the radial and angular factors that neighbouring states share are
+    computed once per worker.
+    Args:
+        states (iterable): (n, l, m) tuples, e.g. all_states(7)
+        a0_scale_factor (float): Bohr radius scale factor, or None to fit
+            every state with gallery_scale_factor(n)
+        dark_theme (bool): If True, uses a dark background for the plots
+        colormap (str): Seaborn plot colormap, defaults to 'rocket'
+        out_dir (str): directory of the PNG files
+        processes (int): number of worker processes, defaults to the CPU count
+        grid_extent, grid_resolution, dtype: grid of compute_wavefunction
+    Returns:
+        list: file names of the rendered images
+    """
+
+    states = [tuple(state) for state in states]
+    for n, l, m in states:
+        validate_state(n, l, m, colormap)
+    os.makedirs(out_dir, exist_ok=True)
+    grid = (grid_extent, grid_resolution, dtype)
+    tasks = [(state, a0_scale_factor, dark_theme, colormap, out_dir, grid) for state in states]
+    processes = processes or os.cpu_count()
+    chunksize = max(len(tasks) // (4 * processes), 1)
+    with ProcessPoolExecutor(processes, initializer=_init_gallery_worker) as pool:
+        return list(pool.map(_render_state, tasks, chunksize=chunksize))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Hydrogen atom wavefunction electron densities')
+    parser.add_argument('--gallery', type=int, metavar='N_MAX',
+                        help='render all states up to n = N_MAX to PNG files instead of plotting one')
+    parser.add_argument('--a0', type=float, default=None,
+                        help='Bohr radius scale factor of the gallery (default: fitted per n)')
+    parser.add_argument('--light', action='store_true', help='light theme')
+    parser.add_argument('--colormap', default='rocket')
+    parser.add_argument('--out', default='.', help='output directory of the gallery')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--extent', default='480',
+                        help="grid extent, or 'auto' to fit every shell (default: 480)")
+    parser.add_argument('--resolution', type=int, default=680, help='grid points per axis')
+    parser.add_argument('--float32', action='store_true', help='compute in single precision')
+    args = parser.parse_args()
+    grid = (args.extent if args.extent == 'auto' else float(args.extent), args.resolution,
+            np.float32 if args.float32 else np.float64)
+    if args.gallery:
+        for filename in render_gallery(all_states(args.gallery), args.a0, not args.light,
+                                       args.colormap, args.out, args.workers, *grid):
+            print(filename)
+    else:
+        plot_wf_probability_density(6, 3, -1, 0.3, True, 'rocket', *grid)
 
 """The plot depicts the electron probability density for a hydrogen atom in the quantum state n=3, l=2, and m=1. This corresponds to a 3d orbital, displaying a clover-shaped distribution pattern with two lobes, indicating regions of higher electron probability, as shown by the bright spots.
 
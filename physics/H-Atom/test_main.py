@@ -0,0 +1,46 @@
+import importlib.util
+import math
+import os
+
+import numpy as np
+import pytest
+
+# The directory name is not a valid package name, so load main.py by path
+_spec = importlib.util.spec_from_file_location('h_atom_main', os.path.join(os.path.dirname(__file__), 'main.py'))
+main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(main)
+
+
+def test_recurrences_match_scipy():
+    errors = main.compare_with_scipy(n_max=10)
+    assert errors['radial'] < 1e-12
+    assert errors['polar'] < 1e-12
+
+
+@pytest.mark.parametrize('l', [0, 25, 49])
+def test_radial_normalized_at_n_50(l):
+    n = 50
+    r = np.linspace(0, n * (2 * n + 30), 400001)
+    R = main.radial_function(n, l, r, 1.0)
+    assert np.all(np.isfinite(R))
+    assert np.trapezoid((r * R) ** 2, r) == pytest.approx(1, abs=1e-9)
+
+
+def test_polar_normalized_at_l_m_120():
+    x = np.linspace(-1, 1, 200001)
+    P = main.polar_function(120, 120, x)
+    assert np.all(np.isfinite(P))
+    # ∫ |Yₗₘ|² dΩ = 1 with the azimuthal factor e^(imφ) integrating to 2π
+    assert 2 * math.pi * np.trapezoid(P ** 2, x) == pytest.approx(1, abs=1e-9)
+
+
+def test_cache_evict_skips_files_being_written(tmp_path):
+    cache = main.ArrayCache(str(tmp_path), max_bytes=0)
+    writing = tmp_path / 'partial.tmp'
+    writing.write_bytes(b'\0' * 1024)
+    cache.store(('a',), np.zeros(16))
+    assert writing.exists()
+    assert not any(path.suffix == '.npy' for path in tmp_path.iterdir())
+    os.utime(writing, (0, 0))
+    cache.evict()
+    assert not writing.exists()
@@ -1,18 +1,173 @@
+import argparse
+import csv
+import glob
+import heapq
+import itertools
+import os
 import numpy as np
 import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
+from matplotlib.collections import PolyCollection
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional, resolve_collisions falls back to NumPy
+    njit = None
 
 plt.style.use('dark_background')  # comment out for "light" theme
 plt.rcParams["font.size"] = 12
 
-np.random.seed(0)
 
+def _particle_field(name):
+    def get(self):
+        return getattr(self.sim, name)[self.id]
 
-class Particle():
+    def set(self, value):
+        getattr(self.sim, name)[self.id] = value
+    return property(get, set)
 
-    def __init__(self, id=0, r=np.zeros(2), v=np.zeros(2), R=1E-2, m=1, color="blue"):
-        self.id, self.r, self.v, self.R, self.m, self.color = id, r, v, R, m, color
+
+class Particle():
+    """Thin view of one row of the particle arrays owned by a Sim."""
+
+    r = _particle_field("r")
+    v = _particle_field("v")
+    R = _particle_field("radius")
+    m = _particle_field("mass")
+    color = _particle_field("colors")
+
+    def __init__(self, sim, id=0):
+        self.sim, self.id = sim, id
+
+
+def cell_list_pairs(r, cell_size, X, Y):
+    """ Broad phase collision search on a uniform grid (cell list).
+    Args:
+        r (numpy.ndarray): (N,2) particle positions, box centered at the origin
+        cell_size (float): minimum cell width, at least the largest contact distance
+        X, Y (float): box size
+    Returns:
+        tuple: arrays (i, j), i < j, of all pairs in the same or adjacent cells,
+        sorted by i then j
+    """
+    N = len(r)
+    nx = max(int(X // cell_size), 1)
+    ny = max(int(Y // cell_size), 1)
+    # Particles slightly outside the box are clipped into the border cells,
+    # which never separates two particles that are within one cell width
+    cx = np.clip(np.floor((r[:, 0] + X/2) * (nx / X)), 0, nx-1).astype(np.intp)
+    cy = np.clip(np.floor((r[:, 1] + Y/2) * (ny / Y)), 0, ny-1).astype(np.intp)
+    cell = cy*nx + cx
+
+    order = np.argsort(cell, kind="stable")
+    counts = np.bincount(cell, minlength=nx*ny)
+    starts = np.cumsum(counts) - counts
+
+    pairs_i, pairs_j = [], []
+    # Half stencil: every pair of neighbouring cells is visited exactly once
+    for dx, dy in ((0, 0), (1, 0), (-1, 1), (0, 1), (1, 1)):
+        ncx, ncy = cx + dx, cy + dy
+        valid = np.flatnonzero((ncx >= 0) & (ncx < nx) & (ncy < ny))
+        neighbour = ncy[valid]*nx + ncx[valid]
+        n = counts[neighbour]
+        i = np.repeat(valid, n)
+        offsets = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        j = order[np.repeat(starts[neighbour], n) + offsets]
+        if dx == 0 and dy == 0:
+            keep = i < j
+            i, j = i[keep], j[keep]
+        pairs_i.append(i)
+        pairs_j.append(j)
+
+    i = np.concatenate(pairs_i)
+    j = np.concatenate(pairs_j)
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    order = np.argsort(i*N + j, kind="stable")
+    return i[order], j[order]
+
+
+def _resolve_collisions_numpy(r, v, mass, radius, i, j):
+    dr = r[i] - r[j]
+    drdr = np.einsum("ij,ij->i", dr, dr)
+    hit = np.flatnonzero(drdr <= (radius[i] + radius[j])**2)
+    i, j, dr, drdr = i[hit], j[hit], dr[hit], drdr[hit]
+
+    # A particle takes part in at most one collision per step: its first
+    # overlapping pair in (i, j) order. Contested pairs wait for the next step.
+    pair = np.arange(len(i))
+    first = np.full(len(r), len(i))
+    np.minimum.at(first, i, pair)
+    np.minimum.at(first, j, pair)
+    keep = (first[i] == pair) & (first[j] == pair)
+    i, j, dr, drdr = i[keep], j[keep], dr[keep], drdr[keep]
+
+    m1, m2 = mass[i], mass[j]
+    f = 2*np.einsum("ij,ij->i", v[i] - v[j], dr) / ((m1+m2)*drdr)
+    v[i] -= (m2*f)[:, None]*dr
+    v[j] += (m1*f)[:, None]*dr
+    return len(i)
+
+
+def _resolve_collisions_loop(r, v, mass, radius, i, j):
+    # Same rule as _resolve_collisions_numpy, written as loops for numba
+    first = np.full(len(r), len(i))
+    for p in range(len(i) - 1, -1, -1):
+        a, b = i[p], j[p]
+        dx, dy = r[a, 0] - r[b, 0], r[a, 1] - r[b, 1]
+        if dx*dx + dy*dy <= (radius[a] + radius[b])**2:
+            first[a] = p
+            first[b] = p
+    n = 0
+    for p in range(len(i)):
+        a, b = i[p], j[p]
+        if first[a] != p or first[b] != p:
+            continue
+        dx, dy = r[a, 0] - r[b, 0], r[a, 1] - r[b, 1]
+        m1, m2 = mass[a], mass[b]
+        f = 2*((v[a, 0] - v[b, 0])*dx + (v[a, 1] - v[b, 1])*dy) / ((m1+m2)*(dx*dx + dy*dy))
+        v[a, 0] -= m2*f*dx
+        v[a, 1] -= m2*f*dy
+        v[b, 0] += m1*f*dx
+        v[b, 1] += m1*f*dy
+        n += 1
+    return n
+
+
+_resolve_collisions_jit = njit(_resolve_collisions_loop) if njit else None
+
+
+def resolve_collisions(r, v, mass, radius, i, j, backend=None):
+    """ Batched narrow phase: overlap test and elastic response for all
+    candidate pairs at once. v is updated in place.
+    Args:
+        r, v (numpy.ndarray): (N,2) positions and velocities
+        mass, radius (numpy.ndarray): (N,) particle properties
+        i, j (numpy.ndarray): candidate pairs, i < j, sorted by i then j
+        backend (str): "numba" or "numpy", defaults to numba when installed
+    Returns:
+        int: number of resolved collisions
+    """
+    if backend is None:
+        backend = "numba" if _resolve_collisions_jit else "numpy"
+    if backend == "numba":
+        if _resolve_collisions_jit is None:
+            raise ValueError("The numba backend requires numba to be installed")
+        return _resolve_collisions_jit(r, v, mass, radius, i, j)
+    if backend == "numpy":
+        return _resolve_collisions_numpy(r, v, mass, radius, i, j)
+    raise ValueError("Unrecognized backend: %s" % backend)
+
+
+def bin_counts(values, edges):
+    """Same counts as np.histogram(values, edges)[0], from a sorted search
+    over the fixed edges and a bincount."""
+    nbins = len(edges) - 1
+    k = np.searchsorted(edges, values, side="right") - 1
+    # np.histogram closes the last bin on the right
+    k[values == edges[-1]] = nbins - 1
+    return np.bincount(k[(k >= 0) & (k < nbins)], minlength=nbins)
 
 
 class Sim():
@@ -20,135 +175,502 @@ class Sim():
     X = 2
     Y = 2
 
-    def __init__(self, dt=50E-6, Np=50):
-        self.dt, self.Np = dt, Np
-        self.particles = [Particle(i) for i in range(self.Np)]
+    def __init__(self, dt=50E-6, Np=50, broad_phase="grid", mode="fixed", X=None, Y=None):
+        if broad_phase not in ("grid", "all_pairs"):
+            raise ValueError("Unrecognized broad phase: %s" % broad_phase)
+        if mode not in ("fixed", "event"):
+            raise ValueError("Unrecognized mode: %s" % mode)
+        self.dt, self.Np, self.broad_phase, self.mode = dt, Np, broad_phase, mode
+        if X is not None:
+            self.X = X
+        if Y is not None:
+            self.Y = Y
+        self.t = 0
+        self._events = None
+        # Structure of arrays: one row per particle
+        self.r = np.zeros((Np, 2))
+        self.v = np.zeros((Np, 2))
+        self.mass = np.ones(Np)
+        self.radius = np.full(Np, 1E-2)
+        self.colors = ["blue"]*Np
+        self.particles = [Particle(self, i) for i in range(self.Np)]
 
     def collision_detection(self):
-        ignore_list = []
-        for particle1 in self.particles:
-            if particle1 in ignore_list:
+        r, v, R = self.r, self.v, self.radius
+        v[(r[:, 0] > self.X/2 - R) | (r[:, 0] < -self.X/2 + R), 0] *= -1
+        v[(r[:, 1] > self.Y/2 - R) | (r[:, 1] < -self.Y/2 + R), 1] *= -1
+        i, j = self.candidate_pairs()
+        resolve_collisions(r, v, self.mass, R, i, j)
+
+    def candidate_pairs(self):
+        """Index pairs (i, j), i < j, of particles close enough to touch."""
+        if self.broad_phase == "all_pairs":
+            # Reference: every pair of particles
+            return np.triu_indices(self.Np, 1)
+        return cell_list_pairs(self.r, 2*self.radius.max(), self.X, self.Y)
+
+    def start_events(self):
+        """(Re)build the event queue of the event-driven mode from the current
+        state. Call again after changing r or v by hand."""
+        # Exact dynamics need a valid start: nobody inside a wall
+        np.clip(self.r[:, 0], -self.X/2 + self.radius, self.X/2 - self.radius, out=self.r[:, 0])
+        np.clip(self.r[:, 1], -self.Y/2 + self.radius, self.Y/2 - self.radius, out=self.r[:, 1])
+        self._events = []
+        self._event_ids = itertools.count()
+        self._collisions = np.zeros(self.Np, dtype=np.int64)
+        for k in range(self.Np):
+            self.predict(k)
+
+    def predict(self, k, walls=True):
+        """Push the next wall and particle collision of particle k, assuming
+        straight flight from the current time. Only the earliest partner is
+        queued; if that partner is deflected first, k is predicted again."""
+        counts = self._collisions
+        if walls:
+            t_wall, wall = np.inf, None
+            for axis, L in enumerate((self.X, self.Y)):
+                v = self.v[k, axis]
+                if v != 0:
+                    edge = np.copysign(L/2 - self.radius[k], v)
+                    t = max((edge - self.r[k, axis]) / v, 0)
+                    if t < t_wall:
+                        t_wall, wall = t, -1 - axis
+            if wall is not None:
+                heapq.heappush(self._events, (self.t + t_wall, next(self._event_ids),
+                                              k, wall, counts[k], 0))
+
+        dr = self.r - self.r[k]
+        dv = self.v - self.v[k]
+        b = np.einsum("ij,ij->i", dr, dv)
+        dvdv = np.einsum("ij,ij->i", dv, dv)
+        drdr = np.einsum("ij,ij->i", dr, dr)
+        sigma2 = (self.radius + self.radius[k])**2
+        d = b**2 - dvdv*(drdr - sigma2)
+        hit = (b < 0) & (d >= 0)
+        hit[k] = False
+        if not hit.any():
+            return
+        candidates = np.flatnonzero(hit)
+        t = -(b[candidates] + np.sqrt(d[candidates])) / dvdv[candidates]
+        # Pairs that already overlap and still approach collide right away
+        np.maximum(t, 0, out=t)
+        n = np.argmin(t)
+        j = candidates[n]
+        heapq.heappush(self._events, (self.t + t[n], next(self._event_ids),
+                                      k, j, counts[k], counts[j]))
+
+    def advance_to(self, t_end):
+        """Event-driven mode: fly to every predicted collision up to t_end,
+        resolve it exactly and finally drift to t_end."""
+        if self._events is None:
+            self.start_events()
+        counts = self._collisions
+        while self._events and self._events[0][0] <= t_end:
+            t, _, k, j, ck, cj = heapq.heappop(self._events)
+            if counts[k] != ck:
+                continue
+            if j >= 0 and counts[j] != cj:
+                self.predict(k, walls=False)
+                continue
+            self.r += (t - self.t) * self.v
+            self.t = t
+
+            if j < 0:
+                axis = -1 - j
+                L = (self.X, self.Y)[axis]
+                self.r[k, axis] = np.copysign(L/2 - self.radius[k], self.r[k, axis])
+                self.v[k, axis] *= -1
+                counts[k] += 1
+                self.predict(k)
                 continue
-            x, y = particle1.r
-            if ((x > self.X/2 - particle1.R) or (x < -self.X/2+particle1.R)):
-                particle1.v[0] *= -1
-            if ((y > self.Y/2 - particle1.R) or (y < -self.Y/2+particle1.R)):
-                particle1.v[1] *= -1
-
-            for particle2 in self.particles:
-                if id(particle1) == id(particle2):
-                    continue
-                m1, m2, r1, r2, v1, v2 = particle1.m, particle2.m, particle1.r, particle2.r, particle1.v, particle2.v
-                if np.dot(r1-r2, r1-r2) <= (particle1.R + particle2.R)**2:
-                    v1_new = v1 - 2*m1 / \
-                        (m1+m2) * np.dot(v1-v2, r1-r2) / \
-                        np.dot(r1-r2, r1-r2)*(r1-r2)
-                    v2_new = v2 - 2*m1 / \
-                        (m1+m2) * np.dot(v2-v1, r2-r1) / \
-                        np.dot(r2-r1, r2-r1)*(r2-r1)
-                    particle1.v = v1_new
-                    particle2.v = v2_new
-                    ignore_list.append(particle2)
+
+            m1, m2 = self.mass[k], self.mass[j]
+            dr = self.r[j] - self.r[k]
+            dv = self.v[j] - self.v[k]
+            J = 2*np.dot(dv, dr) / ((m1+m2)*np.dot(dr, dr)) * dr
+            self.v[k] += m2*J
+            self.v[j] -= m1*J
+            counts[k] += 1
+            counts[j] += 1
+            self.predict(k)
+            self.predict(j)
+
+        self.r += (t_end - self.t) * self.v
+        self.t = t_end
+
+    def sample(self, times):
+        """Event-driven mode: yield (t, positions) at the given output times."""
+        for t in times:
+            self.advance_to(t)
+            yield self.t, self.r.copy()
 
     def increment(self):
+        if self.mode == "event":
+            self.advance_to(self.t + self.dt)
+            return
         self.collision_detection()
-        for particle in self.particles:
-            particle.r += self.dt * particle.v
+        self.r += self.dt * self.v
+        self.t += self.dt
 
     def particle_positions(self):
-        return [particle.r for particle in self.particles]
+        return self.r
 
     def particle_colors(self):
-        return [particle.color for particle in self.particles]
+        return self.colors
 
     def particle_speeds(self):
-        return [np.sqrt(np.dot(particle.v, particle.v)) for particle in self.particles]
+        return np.sqrt(np.einsum("ij,ij->i", self.v, self.v))
+
+    def speed_histogram(self, bins):
+        return bin_counts(self.particle_speeds(), bins)
 
     def E_avg(self):
-        E_avg = 0
-        for particle in self.particles:
-            E_avg += 0.5*particle.m*np.dot(particle.v, particle.v)
-        return E_avg/len(self.particles)
+        return 0.5*np.dot(self.mass, np.einsum("ij,ij->i", self.v, self.v))/self.Np
 
     def temperature(self):
         return self.E_avg()*(2/3)/1.380649E-23
 
 
 # sim variables
-Np = 50
 
-m = 127*1.66E-27
-T_init = 493.15
-
-v_avg = np.sqrt(3/2*1.380649E-23*T_init*2/m)
-
-sim = Sim(Np=Np)
-
-for particle in sim.particles:
-    particle.m = m
-    particle.r = np.random.uniform(
-        [-sim.X/2, -sim.Y/2], [sim.X/2, sim.Y/2], size=2)
-    particle.v = v_avg * np.array([np.cos(np.pi/4), np.cos(np.pi/4)])
-
-sim.particles[0].color = "red"
+speed_bins = np.arange(0, 500, 25)
+
+
+def make_gas(Np=50, m=127*1.66E-27, T_init=493.15, rng=None, **kwargs):
+    """ Gas of Np equal particles at random positions, all with the speed of
+    temperature T_init and moving in the same direction.
+    Args:
+        Np (int): number of particles
+        m (float): particle mass in kg
+        T_init (float): initial temperature in K
+        rng: seed or numpy Generator for the initial positions
+        **kwargs: passed on to Sim
+    Returns:
+        Sim: the initialized simulation
+    """
+    v_avg = np.sqrt(3/2*1.380649E-23*T_init*2/m)
+    rng = np.random.default_rng(rng)
+
+    sim = Sim(Np=Np, **kwargs)
+
+    sim.mass[:] = m
+    sim.r[:] = rng.uniform(
+        [-sim.X/2, -sim.Y/2], [sim.X/2, sim.Y/2], size=(Np, 2))
+    sim.v[:] = v_avg * np.array([np.cos(np.pi/4), np.cos(np.pi/4)])
+
+    sim.particles[0].color = "red"
+    return sim
+
+
+# observables stream
+
+def stream(sim, n_steps, stride=1, bins=speed_bins, positions=False):
+    """ Advance sim by n_steps increments at full speed and yield its
+    observables every stride steps.
+    Returns:
+        generator: dicts with step, t, temperature, E_avg and hist, and with
+        positions=True also a copy of the (Np, 2) particle positions
+    """
+    for step in range(1, n_steps+1):
+        sim.increment()
+        if step % stride == 0:
+            record = {"step": step, "t": sim.t, "temperature": sim.temperature(),
+                      "E_avg": sim.E_avg(), "hist": sim.speed_histogram(bins)}
+            if positions:
+                record["positions"] = np.array(sim.particle_positions())
+            yield record
+
+
+class StreamWriter():
+    """Collects stream records and writes them to out_dir as numbered .npz
+    chunks of `chunk` records each, so long runs never hold their whole
+    history in memory."""
+
+    def __init__(self, out_dir, bins=speed_bins, chunk=1000):
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir, self.bins, self.chunk = out_dir, np.asarray(bins), chunk
+        self.records, self.n_chunks = [], 0
+
+    def write(self, record):
+        self.records.append(record)
+        if len(self.records) >= self.chunk:
+            self.flush()
+
+    def flush(self):
+        if not self.records:
+            return
+        columns = {key: np.array([record[key] for record in self.records])
+                   for key in self.records[0]}
+        np.savez(os.path.join(self.out_dir, "chunk_%05d.npz" % self.n_chunks),
+                 bins=self.bins, **columns)
+        self.records = []
+        self.n_chunks += 1
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_stream(out_dir):
+    """Concatenate the chunks written by StreamWriter into one dict of arrays."""
+    paths = sorted(glob.glob(os.path.join(out_dir, "chunk_*.npz")))
+    if not paths:
+        raise FileNotFoundError("No stream chunks in %s" % out_dir)
+    chunks = [np.load(path) for path in paths]
+    data = {key: np.concatenate([chunk[key] for chunk in chunks])
+            for key in chunks[0].files if key != "bins"}
+    data["bins"] = chunks[0]["bins"]
+    return data
+
+
+def iter_stream(data):
+    """Split the arrays of read_stream back into one record per sample, e.g.
+    to replay a saved run with animate."""
+    columns = {key: value for key, value in data.items() if key != "bins"}
+    for i in range(len(columns["step"])):
+        yield {key: value[i] for key, value in columns.items()}
+
+
+def run_headless(sim, n_steps, out_dir, stride=100, bins=speed_bins, chunk=1000,
+                 positions=False):
+    """Run sim without a display, streaming its observables to out_dir."""
+    with StreamWriter(out_dir, bins, chunk) as writer:
+        for record in stream(sim, n_steps, stride, bins, positions):
+            writer.write(record)
+
+
+# parameter sweeps
+
+def speed_distance(hist, bins, m, E_avg):
+    """ Total variation distance between a speed histogram and the binned
+    equilibrium speed distribution of the 2-D gas, which for kT = E_avg is
+    the Rayleigh distribution 1 - exp(-m v^2 / 2kT).
+    Args:
+        hist (numpy.ndarray): (..., len(bins)-1) particle counts
+        bins (numpy.ndarray): speed bin edges
+        m (float): particle mass
+        E_avg (float): mean kinetic energy per particle
+    Returns:
+        numpy.ndarray: distance between 0 and 1 for every histogram
+    """
+    p = np.diff(1 - np.exp(-m*np.asarray(bins, dtype=float)**2/(2*E_avg)))
+    counts = np.asarray(hist, dtype=float)
+    return 0.5*np.abs(counts/counts.sum(axis=-1, keepdims=True) - p).sum(axis=-1)
+
+
+def relaxation_time(t, distance):
+    """ Time at which the distance to equilibrium has decayed by 1/e of its
+    initial excess over the noise floor (the mean of the last quarter of
+    the run). Returns nan if that never happens, and also if there are
+    fewer than two samples or the start is not above the floor, since no
+    relaxation can be observed then."""
+    if len(distance) < 2:
+        return np.nan
+    floor = np.mean(distance[-max(len(distance)//4, 1):])
+    if distance[0] <= floor:
+        return np.nan
+    relaxed = np.flatnonzero(distance - floor <= (distance[0] - floor)/np.e)
+    return t[relaxed[0]] if len(relaxed) else np.nan
+
+
+def run_member(params):
+    """ Run one ensemble member headless with its own seeded generator.
+    Args:
+        params (dict): Np, T_init, m, X, Y, seed, n_steps, stride and mode
+    Returns:
+        dict: params plus T_final, relaxation_time and the final histogram
+    """
+    sim = make_gas(params["Np"], params["m"], params["T_init"], rng=params["seed"],
+                   X=params["X"], Y=params["Y"], mode=params["mode"])
+    # Stretch the default bins with the thermal speed of this member
+    bins = speed_bins*np.sqrt(params["T_init"]/493.15 * 127*1.66E-27/params["m"])
+    m, E_avg = sim.mass[0], sim.E_avg()
+
+    # Seeded with the initial state, in case the run is shorter than stride
+    hist = sim.speed_histogram(bins)
+    t, distance = [sim.t], [speed_distance(hist, bins, m, E_avg)]
+    for record in stream(sim, params["n_steps"], params["stride"], bins):
+        t.append(record["t"])
+        distance.append(speed_distance(record["hist"], bins, m, E_avg))
+        hist = record["hist"]
+
+    row = dict(params)
+    row["T_final"] = sim.temperature()
+    row["relaxation_time"] = relaxation_time(np.array(t), np.array(distance))
+    row.update(("hist_%d" % k, count) for k, count in enumerate(hist))
+    return row
+
+
+def run_ensemble(grid, seeds, n_steps, stride=100, mode="fixed", processes=None, out=None):
+    """ Run an independent Sim for every combination of parameters and seeds
+    across a process pool.
+    Args:
+        grid (dict): lists of values for Np, T_init, m, X and Y
+        seeds (list): seeds, every parameter point is run once per seed
+        n_steps (int): increments per member
+        stride (int): steps between samples of the speed distribution
+        mode (str): Sim mode
+        processes (int): number of workers, defaults to all cores
+        out (str): optional path of a .csv file for the results table
+    Returns:
+        list: one result dict per member, see run_member
+    """
+    names = ("Np", "T_init", "m", "X", "Y")
+    members = [dict(zip(names, values), seed=seed, n_steps=n_steps, stride=stride, mode=mode)
+               for values in itertools.product(*(grid[name] for name in names))
+               for seed in seeds]
+    if not members:
+        raise ValueError("The ensemble is empty, every grid entry and seeds need at least one value")
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        rows = list(pool.map(run_member, members))
+
+    if out is not None:
+        with open(out, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
+
+
+class RollingHistogram():
+    """Mean of the last n histograms over fixed edges. The sum is kept
+    running: a push adds the new counts and subtracts the evicted frame of
+    the ring buffer, so the cost does not grow with n."""
+
+    def __init__(self, edges, n, initial=None):
+        self.edges, self.n = np.asarray(edges), n
+        self.frames = np.zeros((n, len(edges) - 1), dtype=np.int64)
+        self.index = 0
+        if initial is not None:
+            self.frames[:] = initial
+        self.total = self.frames.sum(axis=0)
+
+    def push(self, counts):
+        """Add one frame of counts, e.g. bin_counts(values, self.edges)."""
+        evicted = self.frames[self.index]
+        self.total += counts
+        self.total -= evicted
+        evicted[:] = counts
+        self.index = (self.index + 1) % self.n
+
+    def mean(self):
+        return self.total / self.n
 
 
 # plot code
 
-n_avg = 200
-
-fig, (ax, ax2) = plt.subplots(figsize=(5, 8), nrows=2)
-ax.set_xticks([]), ax.set_yticks([])
-ax.set_aspect("equal")
-
-vs = np.arange(0, 500, 25)
-
-scatter = ax.scatter([], [])
-bar = ax2.bar(vs, [0]*len(vs), width=0.9 *
-              np.gradient(vs), align="edge", alpha=0.8)
-
-theo = ax2.plot(vs, 25*Np*(m/(2*np.pi*1.380649E-23*sim.temperature()))**(3/2) * 4 *
-                np.pi*vs**2 * np.exp(-m*vs**2/(2*1.380649E-23*sim.temperature())), color="orange")
-
-T_txt = ax.text(sim.X/2*0.5, sim.Y/2*0.92, s="")
-
-freqs_matrix = np.tile((np.histogram(sim.particle_speeds(), bins=vs)[
-                       0].astype(np.float64)), (n_avg, 1))
-
-
-def init():
-    ax.set_xlim(-sim.X/2, sim.X/2)
-    ax.set_ylim(-sim.Y/2, sim.Y/2)
-    ax2.set_xlim(vs[0], vs[-1])
-    ax2.set_ylim(0, Np)
-    ax2.set(xlabel="Particle Speed (m/s)", ylabel="# of particles")
-    return (scatter, *bar.patches)
-
-
-def update(frame):
-    sim.increment()
-
-    T_txt.set_text(f"{sim.temperature():.2f} K")
-
-    freqs, bins = np.histogram(sim.particle_speeds(), bins=vs)
-    freqs_matrix[frame % n_avg] = freqs
-    freqs_mean = np.mean(freqs_matrix, axis=0)
-    freqs_max = np.max(freqs_mean)
-
-    for rect, height in zip(bar.patches, freqs_mean):
-        rect.set_height(height)
-
-    if np.abs(freqs_max - ax2.get_ylim()[1]) > 10:
-        ax2.set_ylim(0, 5 + ax2.get_ylim()
-                     [1] + (freqs_max - ax2.get_ylim()[1]))
-        fig.canvas.draw()
-
-    scatter.set_offsets(np.array(sim.particle_positions()))
-    scatter.set_color(sim.particle_colors())
-    return (scatter, *bar.patches, T_txt)
-
-
-ani = FuncAnimation(fig, update, frames=range(
-    2400), init_func=init, blit=True, interval=1/30, repeat=False)
-
-plt.show()
\ No newline at end of file
+def animate(sim, records, bins=speed_bins, n_avg=200):
+    """Show the gas and its averaged speed distribution, one frame per record
+    of the stream. The records need positions (see stream); sim only
+    provides the box, the particles and the initial state, so a saved run
+    can be replayed with iter_stream(read_stream(out_dir))."""
+    vs = bins
+    Np, m = sim.Np, sim.mass[0]
+
+    fig, (ax, ax2) = plt.subplots(figsize=(5, 8), nrows=2)
+    ax.set_xticks([]), ax.set_yticks([])
+    ax.set_aspect("equal")
+
+    scatter = ax.scatter([], [])
+    # All bars are one collection whose vertices are updated in one call
+    left = vs[:-1]
+    right = left + 0.9*np.gradient(vs)[:-1]
+    bar_verts = np.zeros((len(left), 4, 2))
+    bar_verts[:, :, 0] = np.stack((left, left, right, right), axis=1)
+    bar = PolyCollection(bar_verts, facecolors="C0", alpha=0.8)
+    ax2.add_collection(bar)
+
+    theo = ax2.plot(vs, 25*Np*(m/(2*np.pi*1.380649E-23*sim.temperature()))**(3/2) * 4 *
+                    np.pi*vs**2 * np.exp(-m*vs**2/(2*1.380649E-23*sim.temperature())), color="orange")
+
+    T_txt = ax.text(sim.X/2*0.5, sim.Y/2*0.92, s="")
+
+    freqs = RollingHistogram(vs, n_avg, initial=sim.speed_histogram(vs))
+
+    def init():
+        ax.set_xlim(-sim.X/2, sim.X/2)
+        ax.set_ylim(-sim.Y/2, sim.Y/2)
+        ax2.set_xlim(vs[0], vs[-1])
+        ax2.set_ylim(0, Np)
+        ax2.set(xlabel="Particle Speed (m/s)", ylabel="# of particles")
+        scatter.set_color(sim.particle_colors())
+        return (scatter, bar)
+
+    def update(record):
+        T_txt.set_text(f"{record['temperature']:.2f} K")
+
+        freqs.push(record["hist"])
+        freqs_mean = freqs.mean()
+        freqs_max = np.max(freqs_mean)
+
+        bar_verts[:, 1:3, 1] = freqs_mean[:, None]
+        bar.set_verts(bar_verts)
+
+        if np.abs(freqs_max - ax2.get_ylim()[1]) > 10:
+            ax2.set_ylim(0, 5 + ax2.get_ylim()
+                         [1] + (freqs_max - ax2.get_ylim()[1]))
+            fig.canvas.draw()
+
+        scatter.set_offsets(record["positions"])
+        return (scatter, bar, T_txt)
+
+    ani = FuncAnimation(fig, update, frames=records, init_func=init, blit=True,
+                        interval=1/30, repeat=False, cache_frame_data=False)
+
+    plt.show()
+    return ani
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Hard sphere gas relaxing to the Maxwell-Boltzmann distribution")
+    parser.add_argument("--Np", type=int, nargs="+", default=[50], help="number of particles")
+    parser.add_argument("--T_init", type=float, nargs="+", default=[493.15], help="initial temperature in K")
+    parser.add_argument("--m", type=float, nargs="+", default=[127*1.66E-27], help="particle mass in kg")
+    parser.add_argument("--X", type=float, nargs="+", default=[Sim.X], help="box width")
+    parser.add_argument("--Y", type=float, nargs="+", default=[Sim.Y], help="box height")
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="random seeds")
+    parser.add_argument("--steps", type=int, default=2400, help="number of increments")
+    parser.add_argument("--mode", choices=("fixed", "event"), default="fixed")
+    parser.add_argument("--headless", metavar="OUT_DIR",
+                        help="run without display and stream the observables to OUT_DIR")
+    parser.add_argument("--ensemble", metavar="OUT_CSV",
+                        help="run every combination of the given values and seeds in a "
+                             "process pool and write the results table to OUT_CSV")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="processes for --ensemble, defaults to all cores")
+    parser.add_argument("--stride", type=int, default=100,
+                        help="steps between streamed records when headless")
+    parser.add_argument("--chunk", type=int, default=1000,
+                        help="records per .npz chunk when headless")
+    parser.add_argument("--positions", action="store_true",
+                        help="also stream the particle positions when headless")
+    parser.add_argument("--replay", metavar="OUT_DIR",
+                        help="animate a run streamed with --headless --positions; "
+                             "the gas options must match that run")
+    args = parser.parse_args()
+
+    if args.ensemble:
+        grid = {"Np": args.Np, "T_init": args.T_init, "m": args.m, "X": args.X, "Y": args.Y}
+        run_ensemble(grid, args.seeds, args.steps, args.stride, args.mode,
+                     args.workers, args.ensemble)
+        raise SystemExit
+
+    sim = make_gas(args.Np[0], args.m[0], args.T_init[0], rng=args.seeds[0],
+                   mode=args.mode, X=args.X[0], Y=args.Y[0])
+
+    if args.headless:
+        run_headless(sim, args.steps, args.headless, args.stride, chunk=args.chunk,
+                     positions=args.positions)
+    elif args.replay:
+        data = read_stream(args.replay)
+        if "positions" not in data:
+            raise SystemExit("%s has no positions, stream it with --positions" % args.replay)
+        animate(sim, iter_stream(data), data["bins"])
+    else:
+        animate(sim, stream(sim, args.steps, positions=True))
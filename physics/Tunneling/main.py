@@ -1,6 +1,111 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from vpython import rate, gcurve, graph, canvas, color
+from scipy.linalg import eigh_tridiagonal
+try:
+    import vpython
+except ImportError:  # fall back to matplotlib for the live plot
+    vpython = None
+
+
+def hamiltonian_tridiagonal(V, dx, m=1, hbar=1):
+    """Diagonal and off-diagonal of the finite-difference Hamiltonian on the
+    grid points of V, with hard walls just outside them."""
+    d = hbar**2/(m*dx**2) + V
+    e = np.full(len(V)-1, -hbar**2/(2*m*dx**2))
+    return d, e
+
+
+def energy_window(p, sig, m=1, hbar=1, n_sigma=6):
+    """Energies holding the spectral content of the packet
+    exp(-x**2/sig**2)*exp(1j*p*x), whose momentum spread is hbar/sig."""
+    dp = hbar/sig
+    return max(p - n_sigma*dp, 0)**2/(2*m), (p + n_sigma*dp)**2/(2*m)
+
+
+def eigenstates(V, dx, m=1, hbar=1, k=None, window=None):
+    """Eigenpairs of the tridiagonal Hamiltonian: all of them, the k lowest,
+    or those with energy inside window = (Emin, Emax). O(N) memory.
+    Returns E and psi with one eigenstate per row, normalized so that
+    sum(|psi|**2*dx) = 1."""
+    d, e = hamiltonian_tridiagonal(V, dx, m, hbar)
+    if window is not None:
+        E, psi = eigh_tridiagonal(d, e, select="v", select_range=window)
+    elif k is not None:
+        E, psi = eigh_tridiagonal(d, e, select="i", select_range=(0, k-1))
+    else:
+        E, psi = eigh_tridiagonal(d, e)
+    return E, psi.T/np.sqrt(dx)
+
+
+def expand(E, psi, Psi0, dx, tol=1e-8):
+    """Coefficients c = <psi_i|Psi0> as one matrix-vector product. States
+    with |c| below tol*max|c| are dropped; returns the kept E, psi and c."""
+    c = np.conj(psi) @ Psi0 * dx
+    keep = np.abs(c) >= tol*np.abs(c).max()
+    return E[keep], psi[keep], c[keep]
+
+
+def propagate(E, psi, c, t, hbar=1):
+    """Psi(x,t) = sum_i c_i psi_i(x) exp(-1j*E_i*t/hbar) for all times of the
+    vector t at once, as a (len(t), N) array: psi.T @ (c*exp(-1j*E*t))."""
+    a = c*np.exp(-1j*np.multiply.outer(np.atleast_1d(t), E)/hbar)
+    if np.isrealobj(psi):
+        # Two real products, so psi never gets copied to complex
+        return a.real @ psi + 1j*(a.imag @ psi)
+    return a @ psi
+
+
+def absorbing_mask(x, width, strength, dt, hbar=1):
+    """exp(-W*dt/hbar) for a complex absorbing potential -iW that rises
+    quadratically to `strength` over `width` at both ends of x."""
+    depth = np.maximum(np.maximum(x[0]+width-x, x-(x[-1]-width)), 0)/width
+    return np.exp(-strength*depth**2*dt/hbar)
+
+
+def propagate_absorbing(E, psi, c, dt, steps, mask, dx, hbar=1):
+    """Like propagate, but after every step of dt the wave function is
+    multiplied by mask and expanded in psi again, so whatever enters the
+    absorbing layers is removed instead of reflected by the walls.
+    Yields Psi after each step."""
+    U = np.exp(-1j*E*dt/hbar)
+    for _ in range(steps):
+        Psi = mask*propagate(E, psi, c*U, 0, hbar)[0]
+        c = np.conj(psi) @ Psi * dx
+        yield Psi
+
+
+class CurveDisplay():
+    """Live x-y curves drawn with vpython gcurves, or with matplotlib lines
+    when vpython is not installed. Every update hands over whole arrays."""
+
+    def __init__(self, xtitle="x", ytitle="", width=500, height=250):
+        if vpython is not None:
+            self.scene = vpython.canvas()
+            self.graph = vpython.graph(xtitle=xtitle, ytitle=ytitle, width=width, height=height)
+        else:
+            self.fig, self.ax = plt.subplots(figsize=(width/100, height/100))
+            self.ax.set(xlabel=xtitle, ylabel=ytitle)
+
+    def curve(self, color):
+        if vpython is not None:
+            return vpython.gcurve(color=getattr(vpython.color, color))
+        line, = self.ax.plot([], [], color=color)
+        return line
+
+    def set_data(self, curve, x, y):
+        if vpython is not None:
+            curve.data = np.column_stack((x, y)).tolist()
+        else:
+            curve.set_data(x, y)
+            self.ax.relim()
+            self.ax.autoscale_view()
+
+    def rate(self, fps):
+        if vpython is not None:
+            vpython.rate(fps)
+        else:
+            plt.pause(1/fps)
+
 
 m = 1
 hbar = 1
@@ -12,6 +117,10 @@ dx = x[1]-x[0]
 p = 40
 V0 = p**2/(2*m)
 sig = 0.15
+# Absorbing layers of this width at both ends (0 keeps the hard walls)
+absorb_width = 0
+#absorb_width = 1.5
+absorb_strength = 2000
 x0 = 2
 V = 0*x
 for i in range(len(V)):
@@ -24,40 +133,32 @@ A = np.sum(np.abs(Psi0)**2*dx)
 Psi0 = Psi0/np.sqrt(A)
 plt.plot(x[1:-1],np.abs(Psi0))
 
-H = (hbar**2/(m*dx**2))*np.diag(np.ones(N-1))+V[1:-1]*np.diag(np.ones(N-1))+ (-hbar**2/(2*m*dx**2))*np.diag(np.ones(N-2),1)+ (-hbar**2/(2*m*dx**2))*np.diag(np.ones(N-2),-1)
-print(H.shape)
+# Only the eigenstates the wavepacket is made of
+E,psi = eigenstates(V[1:-1],dx,m,hbar,window=energy_window(p,sig,m,hbar))
+print(psi.shape)
 
-E,psi = np.linalg.eigh(H)
-psi = psi.T
-
-A = np.sum(np.abs(psi[0])**2*dx)
-psi = psi/np.sqrt(A)
 plt.plot(x[1:-1],psi[0])
 plt.plot(x[1:-1],psi[1])
 plt.plot(x[1:-1],psi[2])
 
 #plt.plot(x,0.003*V)
-scene = canvas()
-g1 = graph(xtitle="x",ytitle="stuff",width=500, height=250)
-f1 = gcurve(color=color.blue)
-fV = gcurve(color=color.red)
+display = CurveDisplay(xtitle="x",ytitle="stuff",width=500, height=250)
+f1 = display.curve("blue")
+fV = display.curve("red")
 
-for i in range(len(V)):
-    fV.plot(x[i],0.003*V[i])
+display.set_data(fV,x,0.003*V)
 
-c = 0*Psi0
-for i in range(len(c)):
-    c[i] = np.sum(np.conj(psi[i])*Psi0*dx)
+E,psi,c = expand(E,psi,Psi0,dx)
 
-t = 0
 dt = 0.001
-while t<0.5:
-    rate(20)
-    Psi = 0*psi[0]
-    fdata = []
-    for i in range(len(c)):
-        Psi = Psi + c[i]*psi[i]*np.exp(-1j*E[i]*t/hbar)
-    for i in range(len(Psi)):
-        fdata = fdata +[[x[i],np.abs(Psi[i])]]
-    f1.data = fdata
-    t = t + dt 
\ No newline at end of file
+times = np.arange(0,0.5,dt)
+if absorb_width > 0:
+    mask = absorbing_mask(x[1:-1],absorb_width,absorb_strength,dt,hbar)
+    frames = (np.abs(Psi) for Psi in propagate_absorbing(E,psi,c,dt,len(times),mask,dx,hbar))
+else:
+    # Evaluate the frames in batches of 50 time points
+    frames = (frame for batch in np.array_split(times,max(len(times)//50,1))
+              for frame in np.abs(propagate(E,psi,c,batch,hbar)))
+for frame in frames:
+    display.rate(20)
+    display.set_data(f1,x[1:-1],frame) 
\ No newline at end of file
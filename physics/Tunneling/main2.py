@@ -45,6 +45,11 @@
 #  Numerical and plotting libraries
 import numpy as np
 import pylab
+from scipy.linalg import get_lapack_funcs
+try:
+    from numba import njit
+except ImportError:  # numba is optional, fdtd_step falls back to NumPy
+    njit = None
 # Set pylab to interactive mode so plots update when run outside ipython
 pylab.ion()
 #=============================================================================
@@ -63,21 +68,241 @@ def free(npts):
 def step(npts,v0):
     "Potential step"
     v = free(npts)
-<<<<<<< HEAD
-    v[npts/2:] = v0
-=======
     v[npts//2:] = v0
->>>>>>> aa0f11049f6f1e2673f9105843998684efbc06f1
     return v
 def barrier(npts,v0,thickness):
     "Barrier potential"
     v = free(npts)
-<<<<<<< HEAD
-    v[npts/2:npts/2+thickness] = v0
-=======
     v[npts//2:npts//2+thickness] = v0
->>>>>>> aa0f11049f6f1e2673f9105843998684efbc06f1
     return v
+def crank_nicolson(V,dx,dt,m=1.0,hbar=1.0):
+    """Crank-Nicolson propagator with hard walls at both ends.
+    The tridiagonal matrix (1 + i dt H/2hbar) is LU-factorized once, so a
+    step is one banded matrix-vector product and one banded solve.
+    Returns a function advancing a complex wave function by dt in place."""
+    a = 0.5j*dt/hbar
+    diag = hbar**2/(m*dx**2) + V[1:-1]
+    off = -hbar**2/(2*m*dx**2)
+    gttrf, gttrs = get_lapack_funcs(('gttrf','gttrs'),dtype=np.complex128)
+    lower = np.full(len(diag)-1,a*off,dtype=np.complex128)
+    lu = gttrf(lower,1+a*diag,lower.copy())[:-1]
+    def step(psi):
+        rhs = (1-a*diag)*psi[1:-1] - a*off*(psi[2:] + psi[:-2])
+        psi[1:-1] = gttrs(*lu,rhs)[0]
+        return psi
+    return step
+def split_step(V,dx,dt,m=1.0,hbar=1.0):
+    """Split-step Fourier propagator (periodic boundaries).
+    The kinetic factor uses the eigenvalues of the same three-point
+    Laplacian as the FDTD and Crank-Nicolson schemes, so all propagators
+    evolve the same lattice Hamiltonian.
+    Returns a function advancing a complex wave function by dt in place."""
+    k = 2*np.pi*np.fft.fftfreq(len(V),dx)
+    kinetic = np.exp(-1j*dt*hbar/(m*dx**2)*(1-np.cos(k*dx)))
+    half_V = np.exp(-0.5j*dt*V/hbar)
+    def step(psi):
+        psi *= half_V
+        psi[:] = np.fft.ifft(kinetic*np.fft.fft(psi))
+        psi *= half_V
+        return psi
+    return step
+def _fdtd_half_step(fu,pa,pr,other,c1,c2V,sign,scratch):
+    # fu = pa + sign*(c1*laplacian(other) - c2V*other), without temporaries.
+    # Works on the last axis, so a leading batch axis is fine.
+    lap = scratch[...,1:-1]
+    np.multiply(other[...,1:-1],2,out=lap)
+    np.subtract(other[...,2:],lap,out=lap)
+    np.add(lap,other[...,:-2],out=lap)
+    lap *= c1
+    if sign > 0:
+        np.add(pa[...,1:-1],lap,out=fu[...,1:-1])
+    else:
+        np.subtract(pa[...,1:-1],lap,out=fu[...,1:-1])
+    #  The end points only get the potential term, on top of their present value
+    fu[...,0] = pr[...,0]
+    fu[...,-1] = pr[...,-1]
+    np.multiply(c2V,other,out=scratch)
+    if sign > 0:
+        np.subtract(fu,scratch,out=fu)
+    else:
+        np.add(fu,scratch,out=fu)
+def _fdtd_step_loop(r_pa,r_pr,r_fu,i_pa,i_pr,i_fu,c1,c2V):
+    # Same update as _fdtd_half_step, as loops for numba
+    n = len(c2V)
+    for k in range(1,n-1):
+        i_fu[k] = i_pa[k] + c1*(r_pr[k+1] - 2*r_pr[k] + r_pr[k-1])
+    i_fu[0] = i_pr[0]
+    i_fu[n-1] = i_pr[n-1]
+    for k in range(n):
+        i_fu[k] -= c2V[k]*r_pr[k]
+    for k in range(1,n-1):
+        r_fu[k] = r_pa[k] - c1*(i_pr[k+1] - 2*i_pr[k] + i_pr[k-1])
+    r_fu[0] = r_pr[0]
+    r_fu[n-1] = r_pr[n-1]
+    for k in range(n):
+        r_fu[k] += c2V[k]*i_pr[k]
+_fdtd_step_jit = njit(_fdtd_step_loop) if njit else None
+def absorbing_potential(npts,width,strength):
+    """Complex absorbing potential.  The Hamiltonian becomes H - iW, with W
+    rising quadratically from 0 to `strength` over the last `width` points
+    at each end, so outgoing waves are absorbed instead of reflected by
+    the hard walls."""
+    W = np.zeros(npts)
+    if width > 0:
+        ramp = strength*(np.arange(1,width+1)/width)**2
+        W[:width] = ramp[::-1]
+        W[npts-width:] = ramp
+    return W
+def fdtd_step(psi_r,psi_i,PA,PR,FU,c1,c2V,scratch,jit=True,absorb=None):
+    """One leapfrog step of the FDTD scheme, written into row FU.
+    Uses slice views, the preallocated scratch array of length N and out=
+    arguments, so no temporaries are allocated; with numba installed (and
+    jit=True) it runs as a compiled loop instead.  The time levels are
+    rotated by returning the new (PA,PR,FU) row indices, not by copying.
+    With psi_r/psi_i of shape (3,B,N), B packets are stepped at once; c1
+    and c2V then broadcast against (B,N), e.g. c1 of shape (B,1).
+    absorb = optional (width, a) with a = W*dt/hbar from absorbing_potential.
+    The -iW term is taken semi-implicitly, future*(1+a) = past*(1-a) + ...,
+    which keeps the leapfrog scheme stable; only the two layers of `width`
+    points are touched."""
+    if jit and _fdtd_step_jit is not None and psi_r.ndim == 2:
+        _fdtd_step_jit(psi_r[PA],psi_r[PR],psi_r[FU],
+                       psi_i[PA],psi_i[PR],psi_i[FU],c1,c2V)
+    else:
+        _fdtd_half_step(psi_i[FU],psi_i[PA],psi_i[PR],psi_r[PR],c1,c2V,1,scratch)
+        _fdtd_half_step(psi_r[FU],psi_r[PA],psi_r[PR],psi_i[PR],c1,c2V,-1,scratch)
+    if absorb is not None:
+        width,a = absorb
+        for layer in (np.s_[...,:width],np.s_[...,-width:]):
+            for psi in (psi_r,psi_i):
+                fu = psi[FU][layer]
+                fu -= a[layer]*psi[PA][layer]
+                fu /= 1 + a[layer]
+    return PR,FU,PA
+def fdtd_batch(V,k0,sigma,x0,steps,X,dx=1.0,m=1.0,hbar=1.0,shared_dt=True,
+               probes=None,tol=1e-3,check=50,absorb_width=0,absorb_strength=0.0):
+    """Evolve a batch of B packets together with the FDTD scheme.
+        V = (B,N) potentials, or one (N,) potential for all
+        k0, sigma, x0 = wavenumbers, widths and start positions, scalars or
+                        length B
+        steps = number of time steps, or a step budget per member
+        X = spatial axis
+        shared_dt = use the smallest critical time step for every member,
+                    so all end at the same time; otherwise every member
+                    runs at its own critical time step
+        probes = optional FluxProbes; the run then stops early once every
+                 member has passed them (see FluxProbes.done, checked every
+                 `check` steps) or used up its step budget.  Members that
+                 ran out of steps keep probes.finished False, their R and T
+                 are not converged.
+        absorb_width, absorb_strength = optional absorbing layers at both
+                                        ends, see absorbing_potential
+    Returns the complex present wave functions (B,N) and the times (B,)."""
+    k0,sigma,x0 = np.broadcast_arrays(*np.atleast_1d(k0,sigma,x0))
+    B,N = len(k0),len(X)
+    steps = np.broadcast_to(steps,(B,))
+    V = np.broadcast_to(V,(B,N))
+    dt = hbar/(2*hbar**2/(m*dx**2)+V.max(axis=1))
+    if shared_dt:
+        dt = np.full(B,dt.min())
+    c1 = (hbar*dt/(m*dx**2))[:,None]
+    c2V = (2*dt/hbar)[:,None]*V
+    absorb = None
+    if absorb_width > 0:
+        W = absorbing_potential(N,absorb_width,absorb_strength)
+        absorb = (absorb_width,(dt/hbar)[:,None]*W)
+    #  Same one-way initial state as the single run: past = present
+    xn = slice(1,N//2)
+    x = X[xn]/dx
+    gg = Gaussian(x,x0[:,None],sigma[:,None])
+    psi_r = np.zeros((3,B,N))
+    psi_i = np.zeros((3,B,N))
+    psi_r[:,:,xn] = np.cos(k0[:,None]*x)*gg
+    psi_i[:,:,xn] = np.sin(k0[:,None]*x)*gg
+    nrm = np.sqrt(dx*(psi_r[1]**2 + psi_i[1]**2).sum(axis=1))[:,None]
+    psi_r /= nrm
+    psi_i /= nrm
+    PA,PR,FU = 0,1,2
+    scratch = np.empty((B,N))
+    if probes is not None:
+        probes.measure(psi_r[PR],psi_i[PR])
+    for t in range(1,steps.max()+1):
+        PA,PR,FU = fdtd_step(psi_r,psi_i,PA,PR,FU,c1,c2V,scratch,absorb=absorb)
+        if probes is not None:
+            probes.update(psi_r[PR],psi_i[PR],dt)
+            if t % check == 0:
+                probes.done(psi_r[PR],psi_i[PR],tol)
+                if np.all(probes.finished | (steps <= t)):
+                    break
+    return psi_r[PR] + 1j*psi_i[PR], t*dt
+class FluxProbes:
+    """Probe surfaces on either side of the potential, between grid points
+    left-1|left and right-1|right.  update() integrates the probability
+    current j = hbar/m Im(psi* dpsi/dx) through them over time
+    (trapezoidal rule, O(1) work per step):
+        R = P(x < left at the start) - integral of j(left) dt
+        T = P(x >= right at the start) + integral of j(right) dt
+    Propagators whose steps are too long to sample the current (the
+    implicit schemes) can call measure() instead, which takes R and T
+    from the probability beyond the probes.  With absorbing layers they
+    also call absorb() after every step, which adds what the layers took
+    out on either side to R and T.
+    done() tells when the packet has filled the interaction region between
+    the probes (probability >= 0.5) and left it again (probability < tol),
+    i.e. R+T has converged to 1 within tol.  From then on R and T of that
+    packet are frozen.  Works on single states (N,) as well as batches
+    (B,N), where done() is true once every member has finished."""
+    def __init__(self,left,right,dx=1.0,m=1.0,hbar=1.0):
+        self.left,self.right = left,right
+        self.dx,self.m,self.hbar = dx,m,hbar
+        self.R = self.T = None
+        self.A_left = self.A_right = 0.0
+    def current(self,psi_r,psi_i,k):
+        "Probability current from grid point k-1 to k."
+        return self.hbar/(self.m*self.dx)*(psi_r[...,k-1]*psi_i[...,k] -
+                                           psi_i[...,k-1]*psi_r[...,k])
+    def measure(self,psi_r,psi_i):
+        psi_p = psi_r**2 + psi_i**2
+        R = self.dx*psi_p[...,:self.left].sum(axis=-1) + self.A_left
+        T = self.dx*psi_p[...,self.right:].sum(axis=-1) + self.A_right
+        if self.R is None:
+            self.R,self.T = R,T
+            self.entered = np.zeros(np.shape(R),dtype=bool)
+            self.finished = np.zeros(np.shape(R),dtype=bool)
+        else:
+            self.R = np.where(self.finished,self.R,R)
+            self.T = np.where(self.finished,self.T,T)
+        self.j_left = self.current(psi_r,psi_i,self.left)
+        self.j_right = self.current(psi_r,psi_i,self.right)
+    def absorb(self,p_before,p_after,W):
+        """Book the probability the absorbing potential W removed during one
+        step, from the densities before and after it.  The loss is split
+        between the two sides by their share of W*|psi|^2."""
+        lost = self.dx*(p_before.sum(axis=-1) - p_after.sum(axis=-1))
+        w = W*(p_before + p_after)
+        w_left = w[...,:self.left].sum(axis=-1)
+        w_right = w[...,self.right:].sum(axis=-1)
+        share = np.divide(w_left,w_left + w_right,
+                          out=np.full(np.shape(lost),0.5),where=w_left + w_right > 0)
+        self.A_left = self.A_left + share*lost
+        self.A_right = self.A_right + (1-share)*lost
+    def update(self,psi_r,psi_i,dt):
+        if self.R is None:
+            raise RuntimeError("Call measure() on the initial state first")
+        j_left = self.current(psi_r,psi_i,self.left)
+        j_right = self.current(psi_r,psi_i,self.right)
+        running = ~self.finished
+        self.R = self.R - running*0.5*dt*(self.j_left + j_left)
+        self.T = self.T + running*0.5*dt*(self.j_right + j_right)
+        self.j_left,self.j_right = j_left,j_right
+    def done(self,psi_r,psi_i,tol=1e-3):
+        psi_p = psi_r[...,self.left:self.right]**2 + psi_i[...,self.left:self.right]**2
+        P_mid = self.dx*psi_p.sum(axis=-1)
+        self.entered |= P_mid >= 0.5
+        self.finished |= self.entered & (P_mid < tol)
+        return bool(np.all(self.finished))
+PROPAGATORS = {'crank-nicolson':crank_nicolson,
+               'split-step':split_step}
 def fillax(x,y,*args,**kw):
     """Fill the space between an array of y values and the x axis.
     All args/kwargs are passed to the pylab.fill function.
@@ -93,8 +318,9 @@ def fillax(x,y,*args,**kw):
 #  variables so they become floats instead of integers.
 #
 N    = 1200     #  Number of spatial points.
-T    = 5*N      #  Number of time steps.  5*N is a nice value for terminating
-                #  before anything reaches the boundaries.
+T    = 20*N     #  Maximum number of time steps.  With a step or barrier the
+                #  flux probes end the run much earlier, once R+T has
+                #  converged; slow packets need more than 5*N steps for that.
 Tp   = 50       #  Number of time steps to increment before updating the plot.
 dx   = 1.0e0    #  Spatial resolution
 m    = 1.0e0    #  Particle mass
@@ -125,6 +351,45 @@ k0 = np.pi/20 # Wavenumber (note that energy is a function of k)
 # potential (so the interaction term can be neglected by computing the energy
 # integral over a region where V=0)
 E = (hbar**2/2.0/m)*(k0**2+0.5/sigma**2)
+# Time integration scheme.  'fdtd' is the explicit leapfrog scheme below;
+# the implicit 'crank-nicolson' and 'split-step' propagators are stable for
+# any dt and cover the same simulated time in STEPS steps.
+METHOD = 'fdtd'
+#METHOD = 'crank-nicolson'
+#METHOD = 'split-step'
+STEPS = T//20
+# Transmission sweep.  Set SWEEP_K0 to an array of wavenumbers to evolve one
+# packet per value in a single batched FDTD run (same potential, sigma and
+# x0) and plot transmission and reflection against the packet energy.
+# Every member gets a step budget of SWEEP_BUDGET times the steps its group
+# velocity needs to cross from x0 past the right probe, capped at SWEEP_STEPS.
+# The sweep always runs with absorbing layers of SWEEP_ABSORB_WIDTH points, so
+# slow packets can take that long without the wall reflections coming back.
+# Members that have not converged by then are left out of the curves and
+# marked instead.  Below about pi/40 the packets disperse faster than they
+# move and rarely converge.
+SWEEP_K0 = None
+#SWEEP_K0 = np.linspace(np.pi/40,np.pi/10,200)
+SWEEP_BUDGET = 2.5
+SWEEP_STEPS = 40*N
+SWEEP_ABSORB_WIDTH = 150
+# Flux probes.  For the step and barrier potentials, probes PROBE_GAP points
+# on either side of the potential measure reflection and transmission, and
+# the run stops as soon as R+T has converged to within TOL (T and STEPS
+# remain the upper limits).  Without probes, a run with absorbing layers stops
+# once less than TOL of the probability is left on the grid.
+PROBE_GAP = int(2*sigma)
+TOL = 1e-3
+# Absorbing boundary layers.  With ABSORB_WIDTH > 0, a complex absorbing
+# potential of that many points at each end swallows outgoing packets, so
+# nothing comes back from the walls and N only has to cover the interaction
+# region plus the layers.  The step potential needs them for the flux probes
+# to converge: its slow transmitted part is still near the probe when the
+# reflections from the hard walls come back.  Set to 0 for the original hard
+# walls.
+ABSORB_WIDTH = 150
+#ABSORB_WIDTH = 0
+ABSORB_STRENGTH = 0.05
 #=============================================================================
 # Code begins
 #
@@ -148,12 +413,21 @@ dt   = hbar/(2*hbar**2/(m*dx**2)+Vmax)         #  Critical time step.
 c1   = hbar*dt/(m*dx**2)                       #  Constant coefficient 1.
 c2   = 2*dt/hbar                               #  Constant coefficient 2.
 c2V  = c2*V  # pre-compute outside of update loop
+W    = absorbing_potential(N,ABSORB_WIDTH,ABSORB_STRENGTH)
+absorb = (ABSORB_WIDTH,W*dt/hbar) if ABSORB_WIDTH > 0 else None
 # Print summary info
 print ('One-dimensional Schrodinger equation - time evolution')
 print ('Wavepacket energy:   ',E)
 print ('Potential type:      ',POTENTIAL)
 print ('Potential height V0: ',V0)
 print ('Barrier thickness:   ',THCK)
+print ('Method:              ',METHOD)
+#  Flux probes around the potential (none for the free particle).
+if POTENTIAL=='free':
+    probes = None
+else:
+    edge = N//2+THCK if POTENTIAL=='barrier' else N//2
+    probes = FluxProbes(max(N//2-PROBE_GAP,1),min(edge+PROBE_GAP,N-1),dx,m,hbar)
 #  Wave functions.  Three states represent past, present, and future.
 psi_r = np.zeros((3,N)) #  Real
 psi_i = np.zeros((3,N)) #  Imaginary
@@ -166,11 +440,7 @@ FU = 2                 #  Future
 #  Initialize wave function.  A present-only state will "split" with half the
 #  wave function propagating to the left and the other half to the right.
 #  Including a "past" state will cause it to propagate one way.
-<<<<<<< HEAD
-xn = range(1,N/2)
-=======
 xn = range(1,N//2)
->>>>>>> aa0f11049f6f1e2673f9105843998684efbc06f1
 x = X[xn]/dx    #  Normalized position coordinate
 gg = Gaussian(x,x0,sigma)
 cx = np.cos(k0*x)
@@ -219,43 +489,108 @@ pylab.draw()
 # I think there's a problem with pylab, because it resets the xlim after
 # plotting the E line.  Fix it back manually.
 pylab.xlim(xmin,xmax)
-#  Direct index assignment is MUCH faster than using a spatial FOR loop, so
-#  these constants are used in the update equations.  Remember that Python uses
-#  zero-based indexing.
-IDX1 = range(1,N-1)                            #  psi [ k ]
-IDX2 = range(2,N)                              #  psi [ k + 1 ]
-IDX3 = range(0,N-2)                            #  psi [ k - 1 ]
-for t in range(T+1):
-    # Precompute a couple of indexing constants, this speeds up the computation
-    psi_rPR = psi_r[PR]
-    psi_iPR = psi_i[PR]
-    #  Apply the update equations.
-    psi_i[FU,IDX1] = psi_i[PA,IDX1] + \
-                      c1*(psi_rPR[IDX2] - 2*psi_rPR[IDX1] +
-                          psi_rPR[IDX3])
-    psi_i[FU] -= c2V*psi_r[PR]
+if METHOD=='fdtd':
+    #  Scratch space for the in-place update kernel
+    scratch = np.empty(N)
+    if probes is not None:
+        probes.measure(psi_r[PR],psi_i[PR])
+    for t in range(T+1):
+        #  Apply the update equations and rotate the time levels:
+        #  PR -> PA and FU -> PR
+        PA,PR,FU = fdtd_step(psi_r,psi_i,PA,PR,FU,c1,c2V,scratch,absorb=absorb)
+        if probes is not None:
+            probes.update(psi_r[PR],psi_i[PR],dt)
+        #  Only plot after a few iterations to make the simulation run faster.
+        if t % Tp == 0:
+            #  Compute observable probability for the plot.
+            psi_p = psi_r[PR]**2 + psi_i[PR]**2
+            #  Update the plots.
+            lineR.set_ydata(psi_r[PR])
+            lineI.set_ydata(psi_i[PR])
+            # Note: we plot the probability density amplified by a factor so it's a
+            # bit easier to see.
+            lineP.set_ydata(6*psi_p)
 
-    psi_r[FU,IDX1] = psi_r[PA,IDX1] - \
-                      c1*(psi_iPR[IDX2] - 2*psi_iPR[IDX1] +
-                          psi_iPR[IDX3])
-    psi_r[FU] += c2V*psi_i[PR]
-    #  Increment the time steps.  PR -> PA and FU -> PR
-    psi_r[PA] = psi_rPR
-    psi_r[PR] = psi_r[FU]
-    psi_i[PA] = psi_iPR
-    psi_i[PR] = psi_i[FU]
-    #  Only plot after a few iterations to make the simulation run faster.
-    if t % Tp == 0:
-        #  Compute observable probability for the plot.
-        psi_p = psi_r[PR]**2 + psi_i[PR]**2
-        #  Update the plots.
-        lineR.set_ydata(psi_r[PR])
-        lineI.set_ydata(psi_i[PR])
-        # Note: we plot the probability density amplified by a factor so it's a
-        # bit easier to see.
-        lineP.set_ydata(6*psi_p)
-
-        pylab.draw()
+            pylab.draw()
+            if probes is not None and probes.done(psi_r[PR],psi_i[PR],TOL):
+                break
+            if probes is None and ABSORB_WIDTH > 0 and dx*psi_p.sum() < TOL:
+                break
+elif METHOD in PROPAGATORS:
+    #  The implicit schemes cover the same time span T*dt in STEPS steps.
+    dt_step = T*dt/STEPS
+    #  The absorbing layers enter as the imaginary part of the potential.
+    propagate = PROPAGATORS[METHOD](V-1j*W,dx,dt_step,m,hbar)
+    psi = psi_r[PR] + 1j*psi_i[PR]
+    if probes is not None:
+        probes.measure(psi.real,psi.imag)
+        psi_p = np.abs(psi)**2
+    for t in range(1,STEPS+1):
+        propagate(psi)
+        #  Whatever the layers absorb has left through one of the probes
+        if probes is not None and ABSORB_WIDTH > 0:
+            psi_p, psi_p_past = np.abs(psi)**2, psi_p
+            probes.absorb(psi_p_past,psi_p,W)
+        if t % max(int(Tp*dt/dt_step),1) == 0:
+            lineR.set_ydata(psi.real)
+            lineI.set_ydata(psi.imag)
+            lineP.set_ydata(6*np.abs(psi)**2)
+            pylab.draw()
+            #  The long implicit steps undersample the current, so R and T
+            #  are read from the probability beyond the probes instead.
+            if probes is not None:
+                probes.measure(psi.real,psi.imag)
+                if probes.done(psi.real,psi.imag,TOL):
+                    break
+            elif ABSORB_WIDTH > 0 and dx*(np.abs(psi)**2).sum() < TOL:
+                break
+    psi_p = np.abs(psi)**2
+else:
+    raise ValueError("Unrecognized method: %s" % METHOD)
+print ('Steps taken:         ',t)
+if probes is not None:
+    print ('Converged:           ',bool(probes.finished))
+    if not probes.finished:
+        print ('WARNING: the packet has not left the region between the probes, '
+               'R and T are not converged.  Raise T or use absorbing layers.')
+    print ('Reflection R:        ',probes.R)
+    print ('Transmission T:      ',probes.T)
+    print ('R+T:                 ',probes.R+probes.T)
+if SWEEP_K0 is not None:
+    if probes is None:
+        raise ValueError("The transmission sweep needs a step or barrier potential")
+    sweep_probes = FluxProbes(probes.left,probes.right,dx,m,hbar)
+    #  Lattice group velocity of each member, and the steps it needs to get
+    #  from x0 past the right probe, tail included
+    v_sweep = hbar*np.sin(SWEEP_K0*dx)/(m*dx)
+    budget = SWEEP_BUDGET*(probes.right*dx - x0*dx + 4*sigma*dx)/(v_sweep*dt)
+    budget = np.minimum(np.ceil(budget),SWEEP_STEPS).astype(int)
+    psi,times = fdtd_batch(V,SWEEP_K0,sigma,x0,budget,X,dx,m,hbar,
+                           probes=sweep_probes,tol=TOL,
+                           absorb_width=SWEEP_ABSORB_WIDTH,
+                           absorb_strength=ABSORB_STRENGTH)
+    converged = sweep_probes.finished
+    #  Not converged members are NaN, which leaves a gap in the curves
+    R_sweep = np.where(converged,sweep_probes.R,np.nan)
+    T_sweep = np.where(converged,sweep_probes.T,np.nan)
+    E_sweep = (hbar**2/2.0/m)*(SWEEP_K0**2+0.5/sigma**2)
+    if not converged.all():
+        print ('WARNING: %d of %d sweep members did not converge within their '
+               'step budget and are left out' % ((~converged).sum(),len(converged)))
+    pylab.figure()
+    pylab.plot(E_sweep,T_sweep,'b',label='Transmission')
+    pylab.plot(E_sweep,R_sweep,'r',label='Reflection')
+    if not converged.all():
+        pylab.plot(E_sweep[~converged],sweep_probes.T[~converged],'x',
+                   color='0.6',label='Not converged')
+        pylab.plot(E_sweep[~converged],sweep_probes.R[~converged],'x',
+                   color='0.6')
+    if Vmax != 0:
+        pylab.axvline(V0,color='k',linestyle=':',label='V0')
+    pylab.xlabel('Wavepacket energy')
+    pylab.title('Potential height: %.2e' % V0)
+    pylab.legend(loc='center right')
+    pylab.draw()
 # So the windows don't auto-close at the end if run outside ipython
 pylab.ioff()
 pylab.show()
\ No newline at end of file
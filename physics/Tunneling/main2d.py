@@ -0,0 +1,277 @@
+#=============================================================================
+#
+#               Two-Dimensional Schrodinger Equation: FDTD and Split-Step
+#
+#       The 2-D counterpart of main2.py.  A wavepacket on an (Ny,Nx) grid is
+#       scattered by an arbitrary potential mask, by default a wall with
+#       slits, so the double slit pattern comes out of the time evolution
+#       instead of a closed-form formula.
+#
+#       NOTES
+#
+#       Two propagators evolve the same lattice Hamiltonian (five-point
+#       Laplacian):
+#
+#       1) 'fdtd': the explicit staggered scheme of Visscher with hard
+#          walls, the real part at whole and the imaginary part at half
+#          time steps.  Both parts are updated in place in the real/imag
+#          views of one complex array, so besides psi only two real arrays
+#          of grid size are kept.  With numba installed the update runs as
+#          a compiled loop.
+#
+#       2) 'split-step': split-step Fourier with periodic boundaries,
+#          stable for any dt.  The kinetic factor is separable and kept as
+#          two 1-D vectors.
+#
+#       Optional absorbing layers damp the wave at the edges of the grid, so
+#       nothing is reflected back into the picture.  Snapshots of |psi|**2
+#       are taken every SNAP steps and either plotted or saved to disk.
+#
+#       BEWARE: as in 1-D, the FDTD time step has a strict upper limit.
+#
+#============================================================================
+import os
+import time
+import numpy as np
+import pylab
+import scipy.fft
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional, the FDTD step falls back to NumPy
+    njit = None
+    prange = range
+#=============================================================================
+# Utility functions
+def wavepacket(X,Y,x0,y0,sigma,kx,ky=0.0):
+    """Gaussian wavepacket exp(-r**2/(2 sigma**2)) exp(i k.r), normalized on
+    the grid spanned by the 1-D axes X and Y.  Returns a complex (Ny,Nx)
+    array with zeros on the boundary."""
+    gx = np.exp(-(X-x0)**2/(2*sigma**2) + 1j*kx*X)
+    gy = np.exp(-(Y-y0)**2/(2*sigma**2) + 1j*ky*Y)
+    psi = np.multiply.outer(gy,gx)
+    psi[[0,-1],:] = 0
+    psi[:,[0,-1]] = 0
+    psi /= np.sqrt((np.abs(psi)**2).sum()*(X[1]-X[0])*(Y[1]-Y[0]))
+    return psi
+def free(Ny,Nx):
+    "Free particle."
+    return np.zeros((Ny,Nx))
+def slits(Ny,Nx,v0,column,thickness,width,separation,n=2):
+    """Wall of height v0 and `thickness` points starting at `column`, with
+    n openings of `width` points whose centres are `separation` points
+    apart, centred in y."""
+    v = free(Ny,Nx)
+    v[:,column:column+thickness] = v0
+    centres = Ny//2 + separation*(np.arange(n) - (n-1)/2)
+    for c in centres.astype(int):
+        v[c-width//2:c-width//2+width,column:column+thickness] = 0
+    return v
+def absorbing_layers(Ny,Nx,width,strength,dt,hbar=1.0):
+    """Damping factors exp(-W dt/hbar) for a complex absorbing potential -iW
+    that rises quadratically to `strength` over `width` points at every
+    edge.  W is a sum of an x and a y profile, so the factor is the outer
+    product of the two returned vectors (fy, fx); only the edge strips of
+    psi ever need to be multiplied."""
+    def profile(n):
+        W = np.zeros(n)
+        ramp = strength*(np.arange(1,width+1)/width)**2
+        W[:width] = ramp[::-1]
+        W[n-width:] = ramp
+        return np.exp(-W*dt/hbar)
+    return profile(Ny),profile(Nx)
+def absorb(psi,fy,fx,width):
+    "Apply the damping factors of absorbing_layers to the edge strips of psi."
+    psi[:width] *= fy[:width,None]
+    psi[-width:] *= fy[-width:,None]
+    psi[:,:width] *= fx[:width]
+    psi[:,-width:] *= fx[-width:]
+def critical_dt(V,dx,m=1.0,hbar=1.0):
+    """Largest stable time step of the staggered FDTD scheme, 2 hbar/Emax,
+    with Emax bounded by the kinetic maximum 4 hbar**2/(m dx**2) plus the
+    largest potential."""
+    return 2*hbar/(4*hbar**2/(m*dx**2) + V.max())
+def _fdtd_2d_half_step(fu,other,c1,diag,scratch,sign):
+    # fu += sign*(diag*other - c1*(sum of the four neighbours of other)),
+    # without temporaries.  diag = 4*c1 + dt*V/hbar.
+    np.multiply(diag,other,out=scratch)
+    if sign > 0:
+        fu += scratch
+    else:
+        fu -= scratch
+    nb = scratch[1:-1,1:-1]
+    np.add(other[2:,1:-1],other[:-2,1:-1],out=nb)
+    nb += other[1:-1,2:]
+    nb += other[1:-1,:-2]
+    nb *= c1
+    if sign > 0:
+        fu[1:-1,1:-1] -= nb
+    else:
+        fu[1:-1,1:-1] += nb
+def _fdtd_2d_loop(re,im,c1,diag):
+    # Same update as _fdtd_2d_half_step, as loops for numba
+    Ny,Nx = re.shape
+    for y in prange(1,Ny-1):
+        for x in range(1,Nx-1):
+            re[y,x] += diag[y,x]*im[y,x] - c1*(im[y-1,x] + im[y+1,x] +
+                                               im[y,x-1] + im[y,x+1])
+    for y in prange(1,Ny-1):
+        for x in range(1,Nx-1):
+            im[y,x] -= diag[y,x]*re[y,x] - c1*(re[y-1,x] + re[y+1,x] +
+                                               re[y,x-1] + re[y,x+1])
+_fdtd_2d_jit = njit(_fdtd_2d_loop,parallel=True) if njit else None
+def fdtd_2d(V,dx,dt,m=1.0,hbar=1.0,jit=True):
+    """Staggered (Visscher) FDTD propagator with hard walls:
+        Re(psi) += dt/hbar H Im(psi),  then  Im(psi) -= dt/hbar H Re(psi)
+    dt must not exceed critical_dt(V,dx,m,hbar).
+    Returns a function advancing a complex wave function by dt in place;
+    it works on the real and imaginary views of psi directly and only
+    keeps the diagonal and one scratch array of grid size."""
+    c1 = hbar*dt/(2*m*dx**2)
+    diag = 4*c1 + dt*V/hbar
+    if jit and _fdtd_2d_jit is not None:
+        def step(psi):
+            _fdtd_2d_jit(psi.real,psi.imag,c1,diag)
+            return psi
+    else:
+        scratch = np.zeros(V.shape)
+        def step(psi):
+            _fdtd_2d_half_step(psi.real,psi.imag,c1,diag,scratch,1)
+            _fdtd_2d_half_step(psi.imag,psi.real,c1,diag,scratch,-1)
+            return psi
+    return step
+def split_step_2d(V,dx,dt,m=1.0,hbar=1.0):
+    """Split-step Fourier propagator (periodic boundaries) for the same
+    five-point lattice Hamiltonian.  exp(-i dt T/hbar) factorizes into an
+    x and a y part, which are applied as broadcast 1-D vectors.
+    Returns a function advancing a complex wave function by dt in place."""
+    Ny,Nx = V.shape
+    kx = 2*np.pi*np.fft.fftfreq(Nx,dx)
+    ky = 2*np.pi*np.fft.fftfreq(Ny,dx)
+    kin_x = np.exp(-1j*dt*hbar/(m*dx**2)*(1-np.cos(kx*dx)))
+    kin_y = np.exp(-1j*dt*hbar/(m*dx**2)*(1-np.cos(ky*dx)))[:,None]
+    half_V = np.exp(-0.5j*dt*V/hbar)
+    def step(psi):
+        psi *= half_V
+        phi = scipy.fft.fft2(psi,overwrite_x=True,workers=-1)
+        phi *= kin_x
+        phi *= kin_y
+        psi[:] = scipy.fft.ifft2(phi,overwrite_x=True,workers=-1)
+        psi *= half_V
+        return psi
+    return step
+PROPAGATORS = {'fdtd':fdtd_2d,
+               'split-step':split_step_2d}
+def evolve(step,psi,steps,stride,layers=None,every=1):
+    """Advance psi in place for `steps` steps and yield (step number,
+    |psi|**2) every `stride` steps, as float32 decimated by `every` in both
+    directions.  layers = optional (fy, fx, width) from absorbing_layers."""
+    for t in range(1,steps+1):
+        step(psi)
+        if layers is not None:
+            absorb(psi,*layers)
+        if t % stride == 0:
+            p = psi[::every,::every]
+            yield t,(p.real**2 + p.imag**2).astype(np.float32)
+
+#=============================================================================
+#
+#  Simulation Constants.
+#
+Nx   = 512      #  Number of grid points along x (propagation direction).
+Ny   = 512      #  Number of grid points along y.
+#Nx = Ny = 2048  #  Large run; use with SNAPSHOT_DIR instead of the live plot
+METHOD = 'fdtd'
+#METHOD = 'split-step'
+STEPS = None    #  Number of time steps; None runs until the packet has
+                #  crossed about 3/4 of the grid.
+SNAP = None     #  Snapshot stride in steps; None gives about 40 snapshots.
+EVERY = 1       #  Keep every EVERY-th point of the snapshots.
+SNAPSHOT_DIR = None  #  Save snapshots as .npy files here instead of plotting.
+#SNAPSHOT_DIR = 'snapshots'
+dx   = 1.0e0    #  Spatial resolution
+m    = 1.0e0    #  Particle mass
+hbar = 1.0e0    #  Plank's constant
+X    = dx*np.arange(Nx)
+Y    = dx*np.arange(Ny)
+# Potential: a wall with slits at 40% of the grid, or no potential at all
+POTENTIAL = 'slits'
+#POTENTIAL = 'free'
+V0     = 10.0                #  Wall height, far above the packet energy
+THCK   = max(Nx//128,2)      #  Wall thickness
+NSLITS = 2                   #  Number of slits
+SLIT_W = max(Ny//32,4)       #  Slit width
+SLIT_D = Ny//8               #  Distance between the slit centres
+#  Initial wave function constants
+sigma = Ny/16                #  Width of the Gaussian envelope
+x0 = Nx/5                    #  Start position
+k0 = np.pi/4                 #  Wavenumber along x
+# Absorbing layers at every edge (0 keeps the hard walls)
+ABSORB_WIDTH = Nx//16
+ABSORB_STRENGTH = 0.05
+#=============================================================================
+# Code begins
+#
+if POTENTIAL=='free':
+    V = free(Ny,Nx)
+elif POTENTIAL=='slits':
+    V = slits(Ny,Nx,V0,int(0.4*Nx),THCK,SLIT_W,SLIT_D,NSLITS)
+else:
+    raise ValueError("Unrecognized potential type: %s" % POTENTIAL)
+#  Time step: the FDTD limit, and a few times more for split-step, which is
+#  only limited by accuracy.
+dt = critical_dt(V,dx,m,hbar)
+if METHOD=='split-step':
+    dt *= 4
+elif METHOD not in PROPAGATORS:
+    raise ValueError("Unrecognized method: %s" % METHOD)
+#  Group velocity hbar*sin(k0 dx)/(m dx) of the lattice dispersion
+vg = hbar*np.sin(k0*dx)/(m*dx)
+if STEPS is None:
+    STEPS = int((0.75*Nx*dx - x0)/(vg*dt))
+if SNAP is None:
+    SNAP = max(STEPS//40,1)
+E = hbar**2/(m*dx**2)*(1-np.cos(k0*dx))
+print ('Two-dimensional Schrodinger equation - time evolution')
+print ('Grid:                 %d x %d' % (Ny,Nx))
+print ('Wavepacket energy:   ',E)
+print ('Potential type:      ',POTENTIAL)
+print ('Method:              ',METHOD)
+print ('Steps, dt:           ',STEPS,dt)
+psi = wavepacket(X,Y,x0,Ny*dx/2,sigma,k0)
+step = PROPAGATORS[METHOD](V,dx,dt,m,hbar)
+layers = None
+if ABSORB_WIDTH > 0:
+    layers = absorbing_layers(Ny,Nx,ABSORB_WIDTH,ABSORB_STRENGTH,dt,hbar) + (ABSORB_WIDTH,)
+if SNAPSHOT_DIR is not None:
+    os.makedirs(SNAPSHOT_DIR,exist_ok=True)
+else:
+    pylab.ion()
+    pylab.figure()
+    image = pylab.imshow(np.abs(psi[::EVERY,::EVERY])**2,origin='lower',
+                         extent=(X[0],X[-1],Y[0],Y[-1]),cmap='magma')
+    pylab.contour(X,Y,V,levels=[0.5*V.max()] if V.max() > 0 else [],colors='w')
+    pylab.xlabel('x')
+    pylab.ylabel('y')
+start = time.perf_counter()
+for t,psi_p in evolve(step,psi,STEPS,SNAP,layers,EVERY):
+    if SNAPSHOT_DIR is not None:
+        np.save(os.path.join(SNAPSHOT_DIR,'snap_%05d.npy' % (t//SNAP)),psi_p)
+    else:
+        image.set_data(psi_p)
+        image.set_clim(0,psi_p.max())
+        pylab.title('t = %.1f' % (t*dt))
+        pylab.pause(0.001)
+elapsed = time.perf_counter() - start
+print ('Time per step:        %.2f ms' % (1e3*elapsed/STEPS))
+print ('Remaining norm:      ',(np.abs(psi)**2).sum()*dx*dx)
+#  Intensity on a screen near the right edge, the counterpart of the
+#  closed-form pattern in physics/doppelspalt.
+if SNAPSHOT_DIR is None:
+    screen = np.abs(psi[:,int(0.75*Nx)])**2
+    pylab.figure()
+    pylab.plot(Y,screen/screen.max())
+    pylab.xlabel('y')
+    pylab.ylabel('Intensity')
+    pylab.title('Screen at x = %d' % int(0.75*Nx))
+    pylab.ioff()
+    pylab.show()
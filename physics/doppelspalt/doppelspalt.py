@@ -1,47 +1,179 @@
+from functools import lru_cache, reduce
 import numpy as np
+import scipy.fft
 import matplotlib.pyplot as plt
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional, interference_pattern falls back to NumPy
+    njit = None
+    prange = range
+
+def aperture_points(slit_positions, aperture, subsamples):
+    # Midpoints of `subsamples` equal parts of every slit opening of width
+    # `aperture`, flattened to one array of point sources
+    if subsamples <= 1 or aperture == 0:
+        return np.asarray(slit_positions, dtype=float)
+    offsets = aperture * ((np.arange(subsamples) + 0.5) / subsamples - 0.5)
+    return np.add.outer(slit_positions, offsets).ravel()
+
+def _pattern_numpy(screen_positions, sources, k, screen_distance, chunk):
+    # Sum of exp(1j*k*r) over all sources, (chunk, num_sources) at a time
+    amplitude = np.empty(len(screen_positions), dtype=complex)
+    rows = max(chunk // len(sources), 1)
+    L2 = screen_distance**2
+    for start in range(0, len(screen_positions), rows):
+        y = screen_positions[start:start + rows]
+        phase = np.subtract.outer(y, sources)
+        phase *= phase
+        phase += L2
+        np.sqrt(phase, out=phase)
+        phase *= k
+        part = np.cos(phase).sum(axis=1)
+        np.sin(phase, out=phase)
+        amplitude[start:start + rows] = part + 1j * phase.sum(axis=1)
+    return amplitude
+
+def _pattern_loop(screen_positions, sources, k, screen_distance):
+    # Same sum as _pattern_numpy, as loops for numba
+    amplitude = np.empty(len(screen_positions), dtype=np.complex128)
+    L2 = screen_distance**2
+    for i in prange(len(screen_positions)):
+        re = 0.0
+        im = 0.0
+        for s in sources:
+            d = screen_positions[i] - s
+            phase = k * np.sqrt(L2 + d * d)
+            re += np.cos(phase)
+            im += np.sin(phase)
+        amplitude[i] = re + 1j * im
+    return amplitude
+
+_pattern_jit = njit(_pattern_loop, parallel=True, fastmath=True) if njit else None
+
+def interference_pattern(screen_positions, slit_positions, wavelength, screen_distance,
+                         aperture=0.0, subsamples=1, chunk=2**22, jit=True):
+    # Intensity on the screen: every slit is split into `subsamples` point
+    # sources across its opening, and their complex amplitudes exp(1j*k*r),
+    # with r the exact distance to the screen point, are summed. The result is
+    # normalized so that all sources in phase give 1. Without numba the sum
+    # is evaluated in blocks of about `chunk` elements to bound the memory.
+    screen_positions = np.asarray(screen_positions, dtype=float)
+    sources = aperture_points(slit_positions, aperture, subsamples)
+    k = 2 * np.pi / wavelength
+    if jit and _pattern_jit is not None:
+        amplitude = _pattern_jit(screen_positions, sources, k, screen_distance)
+    else:
+        amplitude = _pattern_numpy(screen_positions, sources, k, screen_distance, chunk)
+    return np.abs(amplitude)**2 / len(sources)**2
+
+def slit_mask(x, num_slits, slit_spacing, aperture):
+    # 1 inside the openings of `num_slits` slits of width `aperture`,
+    # `slit_spacing` apart and centred on 0, sampled at the positions x
+    centres = slit_spacing * (np.arange(num_slits) - (num_slits - 1) / 2)
+    nearest = np.abs(np.subtract.outer(x, centres)).min(axis=-1)
+    return (nearest < aperture / 2).astype(float)
+
+def circular_mask(x, y, radius):
+    # 1 inside a circular hole of `radius` around the origin, on the grid y x x
+    return (np.add.outer(y**2, x**2) <= radius**2).astype(float)
+
+def _padded(mask, pad, dtype):
+    # mask centred in a zero array `pad` times its size along every axis
+    field = np.zeros([pad * n for n in mask.shape], dtype=dtype)
+    field[tuple(slice((pad - 1) * n // 2, (pad - 1) * n // 2 + n) for n in mask.shape)] = mask
+    return field
+
+def fraunhofer(mask, dx, wavelength, pad=2, dtype=np.complex128):
+    # Far-field pattern of a sampled 1-D or 2-D aperture mask (grid spacing
+    # dx) as one FFT of the zero-padded mask, O(M log M) for M samples.
+    # Returns (directions, intensity): the direction sines wavelength*f along
+    # every axis (one array per axis, ascending), and the intensity with the
+    # same normalization as interference_pattern, 1 for the forward direction
+    # of a fully open mask. Directions with |sin| > 1 are evanescent and set
+    # to 0. On a screen at distance L the paraxial position is L*sin.
+    mask = np.asarray(mask)
+    field = scipy.fft.fftn(_padded(mask, pad, dtype), overwrite_x=True, workers=-1)
+    intensity = np.abs(field)**2 / mask.sum()**2
+    del field
+    intensity = scipy.fft.fftshift(intensity)
+    directions = [wavelength * scipy.fft.fftshift(scipy.fft.fftfreq(pad * n, dx)) for n in mask.shape]
+    # sin² summed over the axes, the outer sum on a 2-D grid
+    sin2 = reduce(np.add.outer, [s**2 for s in directions])
+    intensity *= sin2 <= 1
+    return directions, intensity
+
+def fresnel(mask, dx, wavelength, z, pad=1, dtype=np.complex128, block=512):
+    # Near-field intensity at distance z behind a 1-D or 2-D aperture mask,
+    # with the angular-spectrum propagator exp(1j*z*sqrt(k**2 - |q|**2)):
+    # FFT, multiply, inverse FFT, O(M log M). Evanescent components decay.
+    # The propagator is applied `block` rows at a time, so no second array of
+    # the padded size is needed. The FFT is periodic: leave a dark margin
+    # around the mask, or use pad > 1. Returns the intensity on the grid of
+    # the mask, relative to the incident plane wave.
+    mask = np.asarray(mask)
+    k = 2 * np.pi / wavelength
+    field = scipy.fft.fftn(_padded(mask, pad, dtype), overwrite_x=True, workers=-1)
+    q = [(2 * np.pi * scipy.fft.fftfreq(n, dx))**2 for n in field.shape]
+    last = q[-1] if mask.ndim > 1 else 0
+    for start in range(0, field.shape[0], block):
+        rows = np.add.outer(q[0][start:start + block], last) if mask.ndim > 1 else q[0][start:start + block]
+        field[start:start + block] *= np.exp(1j * z * np.sqrt((k**2 - rows).astype(dtype)))
+    field = scipy.fft.ifftn(field, overwrite_x=True, workers=-1)
+    crop = tuple(slice((pad - 1) * n // 2, (pad - 1) * n // 2 + n) for n in mask.shape)
+    return np.abs(field[crop])**2
+
+@lru_cache(maxsize=64)
+def double_slit_experiment(num_slits, num_points, wavelength, slit_width, distance,
+                           screen_distance=1.0, aperture=0.0, subsamples=1):
+    # Returns (screen_positions, intensity). Patterns already computed are
+    # served from an LRU cache keyed on the arguments, so the arrays are
+    # shared between callers and marked read-only.
 
-def double_slit_experiment(num_slits, num_points, wavelength, slit_width, distance):
     # Calculate the positions of the slits
     slit_positions = np.linspace(-slit_width * (num_slits - 1) / 2, slit_width * (num_slits - 1) / 2, num_slits)
 
     # Calculate the positions on the screen
     screen_positions = np.linspace(-distance / 2, distance / 2, num_points)
 
-    # Initialize the screen intensity
-    screen_intensity = np.zeros_like(screen_positions)
+    # Calculate the interference pattern of all slits at once
+    screen_intensity = interference_pattern(screen_positions, slit_positions, wavelength,
+                                            screen_distance, aperture, subsamples)
 
-    # Calculate the interference pattern
-    for i, screen_pos in enumerate(screen_positions):
-        for slit_pos in slit_positions:
-            # Calculate the path difference
-            path_difference = np.sqrt(slit_pos**2 + screen_pos**2)
+    screen_positions.flags.writeable = False
+    screen_intensity.flags.writeable = False
+    return screen_positions, screen_intensity
 
-            # Calculate the phase difference
-            phase_difference = (2 * np.pi * path_difference) / wavelength
+def plot_pattern(screen_positions, screen_intensity, ax=None, title='Double Slit Interference Pattern'):
+    # Plot an interference pattern into ax (a new figure if None)
+    if ax is None:
+        ax = plt.figure().gca()
+    ax.plot(screen_positions, screen_intensity)
+    ax.set_xlabel('Screen Position')
+    ax.set_ylabel('Intensity')
+    ax.set_title(title)
+    return ax
 
-            # Calculate the intensity at the screen position
-            intensity = np.cos(phase_difference) ** 2
+if __name__ == '__main__':
+    # Parameters
+    num_slits = 2
+    num_points = 1000
+    wavelength = 1e-3
+    slit_width = 1e-2        # distance between neighbouring slits
+    distance = 1             # width of the screen
+    screen_distance = 1      # distance from the slits to the screen
+    aperture = 2e-3          # opening of every slit
+    subsamples = 16          # point sources per opening
 
-            # Add the intensity contribution from each slit
-            screen_intensity[i] += intensity
+    # Run the experiment
+    ax = plot_pattern(*double_slit_experiment(num_slits, num_points, wavelength, slit_width, distance,
+                                              screen_distance, aperture, subsamples))
 
-    # Normalize the intensity
-    screen_intensity /= num_slits
-
-    # Plot the interference pattern
-    plt.plot(screen_positions, screen_intensity)
-    plt.xlabel('Screen Position')
-    plt.ylabel('Intensity')
-    plt.title('Double Slit Interference Pattern')
+    # The same slits as a sampled mask, far field by FFT
+    dx = aperture / 16
+    x = dx * np.arange(-2**14, 2**14)
+    (directions,), intensity = fraunhofer(slit_mask(x, num_slits, slit_width, aperture), dx, wavelength)
+    positions = screen_distance * np.tan(np.arcsin(np.clip(directions, -1, 1)))
+    visible = np.abs(positions) <= distance / 2
+    ax.plot(positions[visible], intensity[visible], '--', label='FFT (Fraunhofer)')
+    ax.legend()
     plt.show()
-
-# Parameters
-num_slits = 2
-num_points = 1000
-wavelength = 1e-3
-slit_width = 1e-4
-distance = 1
-
-# Run the experiment
-double_slit_experiment(num_slits, num_points, wavelength, slit_width, distance)
\ No newline at end of file